@@ -0,0 +1,125 @@
+import time
+
+
+class SolverGaveUp(Exception):
+    """
+    Raised by the solver when a search limit (timeout or max_nodes, see SearchBudget) is reached before the
+    search finds a solution or proves there is none. Unlike the board of -1s returned for unsolvable boards, it says
+    nothing about whether the board has a solution.
+    """
+    def __init__(self, reason, nodes, seconds):
+        """
+        Creates a SolverGaveUp exception.
+        :param reason: The limit that was reached, "timeout" or "max_nodes".
+        :param nodes: The number of nodes expanded before giving up.
+        :param seconds: The number of seconds searched before giving up.
+        """
+        super().__init__(f"Gave up after {nodes} nodes and {seconds:.3f} seconds ({reason} reached)")
+        self.reason = reason
+        self.nodes = nodes
+        self.seconds = seconds
+
+    def __reduce__(self):
+        return SolverGaveUp, (self.reason, self.nodes, self.seconds)  # Keeps the exception picklable across processes
+
+
+class SearchBudget:
+    """
+    The search limits of a solve (a number of nodes and a timeout), counted from its creation. Engines report each node
+    to it when a solve is limited, apart from SolverStats, so limiting a solve doesn't turn on the counting and timing
+    of the search. The node limit is checked on every node, the clock only every CHECK_INTERVAL nodes.
+    """
+    CHECK_INTERVAL = 16  # Nodes between two checks of the clock
+
+    def __init__(self, max_nodes=None, timeout=None):
+        """
+        Creates a SearchBudget Object, starting its clock.
+        :param max_nodes: The number of nodes the search may expand, or None for no limit.
+        :param timeout: The number of seconds the search may run for, or None for no limit.
+        """
+        self.start_time = time.perf_counter()
+        self.max_nodes = max_nodes
+        self.deadline = None if timeout is None else self.start_time + timeout
+        self.nodes = 0  # Number of nodes reported so far
+        self.next_check = 1  # The node count of the next check (the first node), see check
+
+    def node(self):
+        """
+        Records a node being expanded by the search, checking the limits if it is due.
+        :return: None
+        :raises SolverGaveUp: If the node or time limit has been passed.
+        """
+        self.nodes += 1
+        if self.nodes >= self.next_check:
+            self.check()
+
+    def check(self):
+        """
+        Checks the limits and sets the node count of the next check: the node limit or CHECK_INTERVAL nodes from now,
+        whichever comes first (only the node limit without a timeout).
+        :return: None
+        :raises SolverGaveUp: If the node or time limit has been passed.
+        """
+        now = time.perf_counter()
+        if self.max_nodes is not None and self.nodes > self.max_nodes:
+            raise SolverGaveUp("max_nodes", self.nodes - 1, now - self.start_time)
+        if self.deadline is not None and now > self.deadline:
+            raise SolverGaveUp("timeout", self.nodes - 1, now - self.start_time)
+        self.next_check = self.nodes + self.CHECK_INTERVAL if self.deadline is not None else float("inf")
+        if self.max_nodes is not None:
+            self.next_check = min(self.next_check, self.max_nodes + 1)  # The first node over the limit
+
+
+class SolverStats:
+    """
+    Counters collected while solving a board. Pass an instance to sudoku_solver (stats=...) to collect them; when no
+    instance is passed the solver skips all counting and timing.
+    An optional hook is called on every search event, as hook(event, depth, stats), where event is "node" (a value is
+    tried at the given search depth) or "backtrack" (a value tried at the given depth failed and was undone).
+    """
+    def __init__(self, hook=None):
+        """
+        Creates a SolverStats Object with every counter at zero.
+        :param hook: Optional function called on every search event, see the class docstring.
+        """
+        self.nodes = 0  # Number of search nodes expanded, i.e. values tried by the search
+        self.backtracks = 0  # Number of values tried that led to a dead end and were undone
+        self.max_depth = 0  # Deepest search level reached (number of values tried on the current path)
+        self.singles = 0  # Number of positions assigned by naked or hidden single propagation
+        self.candidates_removed = 0  # Number of values removed from the candidates of empty positions
+        self.time_heuristic = 0.0  # Seconds spent choosing the next position (MRV and degree heuristics)
+        self.time_propagation = 0.0  # Seconds spent assigning values and propagating constraints
+        self.time_copy = 0.0  # Seconds spent copying states (dfs) or undoing changes (trail, exact_cover)
+        self.hook = hook
+
+    def node(self, depth):
+        """
+        Records a value being tried by the search.
+        :param depth: The search depth of the value (1 for the first position chosen).
+        :return: None
+        """
+        self.nodes += 1
+        if depth > self.max_depth:
+            self.max_depth = depth
+        if self.hook is not None:
+            self.hook("node", depth, self)
+
+    def backtrack(self, depth):
+        """
+        Records a value tried by the search failing (directly or after searching below it) and being undone.
+        :param depth: The search depth of the value.
+        :return: None
+        """
+        self.backtracks += 1
+        if self.hook is not None:
+            self.hook("backtrack", depth, self)
+
+    def as_dict(self):
+        """
+        Returns the counters as a dictionary, e.g. to report them as JSON.
+        :return: Dictionary of counter name (key) and value (value).
+        """
+        return {name: value for name, value in vars(self).items() if name != "hook"}
+
+    def __repr__(self):
+        return "SolverStats(" + ", ".join(f"{name}={value!r}" for name, value in self.as_dict().items()) + ")"
@@ -1,73 +1,240 @@
+import functools
+import time
+from array import array
+
 import numpy as np
 
+# Precomputed lookup tables, built once per box size n and shared by every state of that size (see get_geometry).
+# A board of n^2 x n^2 positions is stored as a flat array of n^4 cells (cell = row * n^2 + col) and the possible
+# values of a cell are stored as an n^2-bit mask, where bit (value - 1) is set if value is possible.
+INVALID_VALUE = 0xFF  # Placeholder for board values outside the range (0, n^2), rejected by is_valid_board
+MAX_BOX_SIZE = 8  # The candidate masks of larger boards don't fit in an array item (64 bits)
+MASK_VALUES_CACHE_SIZE = 4096  # The number of masks whose values are kept for boards with more than 9 values
+
+
+def get_mask_values(mask):
+    """
+    Finds the possible values of a candidate mask, taking its lowest set bit at a time.
+    :param mask: The candidate mask.
+    :return: Tuple of the possible values, in ascending order.
+    """
+    values = []
+    while mask:
+        bit = mask & -mask  # Lowest set bit
+        values.append(bit.bit_length())
+        mask ^= bit
+    return tuple(values)
+
+
+class BitCountTable:
+    """
+    Lookup table of the number of possible values of each candidate mask, used in place of a precomputed tuple when the
+    board has too many values to build one entry per possible mask. Nothing is stored, each mask is counted as it is
+    looked up.
+    """
+    def __getitem__(self, mask):
+        return bin(mask).count("1")
+
+
+class MaskValuesTable:
+    """
+    Lookup table of the possible values of each candidate mask, used in place of a precomputed tuple when the board has
+    too many values to build one entry per possible mask. The values are computed as they are looked up, only the most
+    recently used masks are kept (at most MASK_VALUES_CACHE_SIZE, shared by every board size).
+    """
+    __getitem__ = staticmethod(functools.lru_cache(maxsize=MASK_VALUES_CACHE_SIZE)(get_mask_values))
+
+
+class BoardGeometry:
+    """
+    The lookup tables of a board with n x n blocks (a board of n^2 x n^2 positions), see get_geometry.
+    The tables are tuples indexed by cell (or unit, or mask), so they can be read exactly like the module level tables
+    of the standard 9x9 board. The mask tables of larger boards compute their entries as they are indexed (see
+    BitCountTable and MaskValuesTable).
+    """
+    def __init__(self, box_size):
+        """
+        Creates a BoardGeometry Object, building the tables of the given box size.
+        :param box_size: The size n of the blocks, in range (1, MAX_BOX_SIZE).
+        """
+        if not 1 <= box_size <= MAX_BOX_SIZE:
+            raise ValueError(f"Box size must be in range (1, {MAX_BOX_SIZE}), got {box_size}")
+        size = box_size * box_size
+        cells = size * size
+        self.box_size = box_size  # n, the width and height of a block
+        self.size = size  # n^2, the width and height of the board, and the number of values
+        self.cells = cells  # n^4, the number of positions
+        self.full_mask = (1 << size) - 1  # Mask with all values (1 - n^2) possible
+        self.mask_typecode = 'H' if size <= 16 else 'L' if size <= 32 else 'Q'  # array typecode fitting a mask
+        cell_row = tuple(cell // size for cell in range(cells))
+        cell_col = tuple(cell % size for cell in range(cells))
+        cell_box = tuple((cell // (size * box_size)) * box_size + (cell % size) // box_size for cell in range(cells))
+        self.cell_row, self.cell_col, self.cell_box = cell_row, cell_col, cell_box  # The row, column and block of cells
+        units = tuple(tuple(cell for cell in range(cells) if cell_row[cell] == i) for i in range(size)) + \
+            tuple(tuple(cell for cell in range(cells) if cell_col[cell] == i) for i in range(size)) + \
+            tuple(tuple(cell for cell in range(cells) if cell_box[cell] == i) for i in range(size))
+        self.units = units  # Rows, columns then blocks
+        self.peers = tuple(tuple(sorted(set(units[cell_row[cell]] + units[size + cell_col[cell]] +
+                                            units[2 * size + cell_box[cell]]) - {cell}))
+                           for cell in range(cells))  # The cells sharing a row, column or block with each cell
+        self.box_line_peers = tuple(tuple(peer for peer in self.peers[cell] if cell_box[peer] == cell_box[cell] and
+                                          (cell_row[peer] == cell_row[cell] or cell_col[peer] == cell_col[cell]))
+                                    for cell in range(cells))  # The peers sharing the block and a row or column
+        self.intersections = tuple((tuple(cell for cell in box if cell in line),
+                                    tuple(cell for cell in box if cell not in line),
+                                    tuple(cell for cell in line if cell not in box))
+                                   for box in units[2 * size:] for line in units[:2 * size] if set(box) & set(line)
+                                   )  # The (shared cells, rest of block, rest of row or column) of each block and line
+        # Number of possible values and the possible values (ascending) of each mask, built up front for small boards:
+        if size <= 16:
+            self.bit_count = tuple(bin(mask).count("1") for mask in range(self.full_mask + 1))
+        else:
+            self.bit_count = BitCountTable()
+        if size <= 9:
+            self.mask_values = tuple(get_mask_values(mask) for mask in range(self.full_mask + 1))
+        else:
+            self.mask_values = MaskValuesTable()
+
+
+GEOMETRIES = {}  # Holds the BoardGeometry (value) of each box size (key) used so far
+
+
+def get_geometry(box_size):
+    """
+    Finds the lookup tables of the given box size, building them the first time the size is used.
+    :param box_size: The size n of the blocks (3 for the standard 9x9 board).
+    :return: The BoardGeometry of the box size.
+    """
+    geometry = GEOMETRIES.get(box_size)
+    if geometry is None:
+        geometry = GEOMETRIES[box_size] = BoardGeometry(box_size)
+    return geometry
+
+
+def get_box_size(shape):
+    """
+    Finds the box size of a board from its shape.
+    :param shape: The shape of the board (n^2 x n^2).
+    :return: The box size n.
+    """
+    box_size = round(shape[0] ** 0.5) if len(shape) == 2 else 0
+    if len(shape) != 2 or shape[0] != shape[1] or box_size * box_size != shape[0] or box_size < 1:
+        raise ValueError(f"Expected an n^2 x n^2 board, got shape {tuple(shape)}")
+    return box_size
+
+
+# Tables of the standard 9x9 board:
+GEOMETRY = get_geometry(3)
+FULL_MASK = GEOMETRY.full_mask  # Mask with all nine values (1 - 9) possible
+CELL_ROW = GEOMETRY.cell_row  # The row of each cell
+CELL_COL = GEOMETRY.cell_col  # The column of each cell
+CELL_BOX = GEOMETRY.cell_box  # The 3x3 block of each cell
+UNITS = GEOMETRY.units  # Rows, columns then blocks
+PEERS = GEOMETRY.peers  # The 20 cells sharing a row, column or block with each cell
+BOX_LINE_PEERS = GEOMETRY.box_line_peers  # The 4 peers sharing both the block and a row or column with each cell
+BIT_COUNT = GEOMETRY.bit_count  # Number of possible values in each mask
+MASK_VALUES = GEOMETRY.mask_values  # The possible values in each mask, in ascending order
+INTERSECTIONS = GEOMETRY.intersections  # The (shared cells, rest of block, rest of line) of each block and line
+
+# Propagation levels, each level applies the rules of the previous levels as well (see SudokuState.propagate):
+PROPAGATION_NONE = 0  # Only remove the assigned value from the peers (forward checking)
+PROPAGATION_NAKED_SINGLES = 1  # Assign positions with only one possible value
+PROPAGATION_HIDDEN_SINGLES = 2  # Assign values that only one position of a row, column or block can take
+PROPAGATION_PAIRS = 3  # Naked and hidden pairs, and pointing / claiming (locked candidates)
+CONTRADICTION = -1  # Returned by the propagation stages when the board is found to have no solution
+
 
 class SudokuState:
     """
     Represents a Sudoku board configuration (the final board values) and the possible moves for the board.
+    The board is stored as a flat array of values, the possible values of each cell as a candidate mask and the values
+    already placed in each row, column and block as "used" masks. Boards of any box size n (n^2 x n^2 positions) are
+    supported, the lookup tables of the size are shared through the state's geometry (see get_geometry).
+    The empty cells are also indexed by the number of values they can take (buckets), which is kept up to date as the
+    candidate masks change. buckets[1] is the worklist of singletons and the first non-empty bucket gives the MRV cells.
     """
+    stats = None  # Optional SolverStats object the propagation counters are added to, shared by copies of the state
+    trail = None  # Optional undo log of (cell, old candidate mask) entries, see undo. Copies of the state don't log
+
     def __init__(self, final_values):
         """
         Creates a SudokuState Object following the given board specifications.
-        :param final_values: The board configuration. Two dimensional (2d) numpy array with values in range (0, 9).
+        :param final_values: The board configuration. Two dimensional (2d) n^2 x n^2 numpy array with values in range
+        (0, n^2), e.g. a 9x9 board with values in range (0, 9).
         """
-        self.final_values = final_values  # Holds the final values on the board
-        self.possible_values = np.empty(shape=(9, 9), dtype=list)  # Holds the possible values each empty slot can take
+        final_values = np.asarray(final_values)
+        self.geometry = geometry = get_geometry(get_box_size(final_values.shape))  # Lookup tables of the board size
+        size, typecode = geometry.size, geometry.mask_typecode
+        self.values = array('B', (int(value) if 0 <= value <= size else INVALID_VALUE
+                                  for value in final_values.ravel().tolist()))  # Flat board values
+        self.candidates = array(typecode, [0]) * geometry.cells  # Holds the candidate mask of each empty cell
+        self.row_used = array(typecode, [0]) * size  # Holds the mask of the values placed in each row
+        self.col_used = array(typecode, [0]) * size  # Holds the mask of the values placed in each column
+        self.box_used = array(typecode, [0]) * size  # Holds the mask of the values placed in each block
+        self.buckets = [set() for _ in range(size + 1)]  # Holds the empty cells with 0 - n^2 possible values
 
-    def init_constraints(self):
+    @property
+    def final_values(self):
         """
-        Go through all empty positions and initialize their possible values, according to the constraints.
-        Called once when the board is first created.
-        :return: None
+        The board configuration as an n^2 x n^2 numpy array.
+        :return: Two dimensional (2d) numpy array with values in range (0, n^2).
         """
-        for (row, col), curr_value in np.ndenumerate(self.final_values):
-            self.possible_values[row][col] = []  # Initialize empty list
-            if curr_value == 0:  # If the final value is 0 then the position is vacant
-                for value in range(1, 10):  # Iterate through all possible values (1, 9) and check if they are possible
-                    if self.__is_valid_value(row, col, value):
-                        self.possible_values[row][col].append(value)  # Append possible values to the corresponding list
-        return
+        size = self.geometry.size
+        return np.frombuffer(self.values, dtype=np.uint8).reshape(size, size).astype(int)
 
-    def __is_valid_value(self, target_row, target_col, value):
+    def get_possible_values(self, cell):
         """
-        Check if the given value is allowed to be placed in the specified position (target_row, target_col).
-        Checks that no duplicate values are in the same row, column or 3x3 block.
-        :param target_row: The row position where the value will be placed.
-        :param target_col: The column position where the value will be placed.
-        :param value: The value that is being evaluated.
-        :return: True if it is a possible (valid) value, False otherwise.
+        Finds the possible values of the given cell.
+        :param cell: The flat position of the cell (row * n^2 + col).
+        :return: Tuple with the possible values of the cell, in ascending order.
         """
-        if value == 0:
-            return True  # 0's are always a valid value since they are a placeholder (signify empty position)
-
-        # Check row and column:
-        for i in range(9):
-            if self.final_values[i][target_col] == value and i != target_row:  # Check column
-                return False  # Value appears on the same column twice
-            if self.final_values[target_row][i] == value and i != target_col:  # Check row
-                return False  # Value appears on the same row twice
-
-        # Find start of 3x3 block:
-        block_row = target_row - (target_row % 3)
-        block_col = target_col - (target_col % 3)
+        return self.geometry.mask_values[self.candidates[cell]]
 
-        # Check each element in the 3x3 block:
-        for row in range(3):
-            for col in range(3):
-                if value == self.final_values[block_row + row][block_col + col] and block_row + row != target_row and block_col + col != target_col:
-                    return False  # Value appears in the same block twice
-
-        return True  # Value does not appear in the same row, col or block
+    def init_constraints(self):
+        """
+        Go through all positions, record the values used in each row, column and block, and then initialize the
+        candidate masks of the empty positions, according to the constraints.
+        Called once when the board is first created.
+        :return: None
+        """
+        values, row_used, col_used, box_used = self.values, self.row_used, self.col_used, self.box_used
+        geometry = self.geometry
+        cell_row, cell_col, cell_box = geometry.cell_row, geometry.cell_col, geometry.cell_box
+        for cell in range(geometry.cells):
+            if values[cell]:
+                bit = 1 << (values[cell] - 1)
+                row_used[cell_row[cell]] |= bit
+                col_used[cell_col[cell]] |= bit
+                box_used[cell_box[cell]] |= bit
+        for cell in range(geometry.cells):
+            if values[cell] == 0:  # If the final value is 0 then the position is vacant
+                used = row_used[cell_row[cell]] | col_used[cell_col[cell]] | box_used[cell_box[cell]]
+                self.candidates[cell] = geometry.full_mask & ~used
+                self.buckets[geometry.bit_count[self.candidates[cell]]].add(cell)  # Index the cell by its values
+            else:
+                self.candidates[cell] = 0  # Filled positions have no possible moves
+        return
 
     def is_valid_board(self):
         """
         Checks whether the given board is a valid sudoku board. (No duplicates on row, col or block).
-        Iterate through every position in the board and check if it is a valid (possible) value, i.e. no duplicates in
-        the same row, column or 3x3 block.
+        Makes a single pass over the board, keeping a mask of the values seen in each row, column and block.
         :return: True if it is valid board, False otherwise.
         """
-        for (row, col), value in np.ndenumerate(self.final_values):  # Iterate through each position
-            if not self.__is_valid_value(row, col, value):  # Check that the value is valid
-                return False  # An invalid (duplicate) value was found
+        geometry = self.geometry
+        row_seen, col_seen, box_seen = [0] * geometry.size, [0] * geometry.size, [0] * geometry.size
+        for cell, value in enumerate(self.values):
+            if value == 0:
+                continue  # 0's are always a valid value since they are a placeholder (signify empty position)
+            if value == INVALID_VALUE:
+                return False  # Value is outside the range (0, n^2)
+            bit = 1 << (value - 1)
+            row, col, box = geometry.cell_row[cell], geometry.cell_col[cell], geometry.cell_box[cell]
+            if (row_seen[row] | col_seen[col] | box_seen[box]) & bit:
+                return False  # Value appears on the same row, column or block twice
+            row_seen[row] |= bit
+            col_seen[col] |= bit
+            box_seen[box] |= bit
         return True
 
     def is_solvable(self):
@@ -75,92 +242,336 @@ class SudokuState:
         Checks if the board is solvable, i.e. each empty position has at least one possible value.
         :return: True if the board is solvable
         """
-        for row, col in np.ndindex(9, 9):
-            if len(self.possible_values[row][col]) < 1 and self.final_values[row][col] == 0:
-                return False
-        return True
+        return not self.buckets[0]  # No empty position has run out of possible values
 
     def is_goal(self):
         """
         Checks if the board has been solved, i.e. there are no empty positions (signified by zeroes).
         :return: True if every position has a value (no zeroes in the state), otherwise False.
         """
-        if 0 in self.final_values:  # Check if any zeroes are in the final states
-            return False
-        return True
+        return 0 not in self.values
 
     def get_singletons(self):
         """
-        Generates a list with the coordinates of all the empty slots that have only 1 possible value (singletons).
-        Called after assignment (generate of new board).
-        :return: List with the coordinates of all the singleton values (row, col).
+        Generates a list with the positions of all the empty slots that have only 1 possible value (singletons).
+        Read from the singleton bucket, which update_constraints keeps up to date.
+        :return: List with the flat positions of all the singleton values (row * n^2 + col).
         """
-        singleton_list = []  # List holding singleton positions (row, col)
-        for row in range(9):
-            for col in range(9):
-                if len(self.possible_values[row][col]) == 1 and self.final_values[row][col] == 0:
-                    singleton_list.append((row, col))  # If it is vacant and has only one possible value append it
-        return singleton_list
+        return list(self.buckets[1])
 
-    def update_constraints(self, target_row, target_col, value):
+    def update_constraints(self, target_cell, value):
         """
-        Update the board's possible values, following an assignment to the given position (row, col).
-        Find and update the affected positions, updating their constraints.
-        :param target_row: The row that the value is to be placed.
-        :param target_col: The column that the value is to be placed.
+        Update the board's possible values, following an assignment to the given position.
+        Marks the value as used in the position's row, column and block and removes it from the candidate masks of the
+        position's peers, moving each peer it changes to the bucket below. If the state has a SolverStats object, the
+        removals are counted.
+        :param target_cell: The flat position (row * n^2 + col) that the value is to be placed.
         :param value: The value that is to be placed in the provided position.
+        :return: False if a peer is left without any possible values, otherwise True.
+        """
+        geometry = self.geometry
+        bit = 1 << (value - 1)
+        self.row_used[geometry.cell_row[target_cell]] |= bit
+        self.col_used[geometry.cell_col[target_cell]] |= bit
+        self.box_used[geometry.cell_box[target_cell]] |= bit
+
+        candidates, buckets, bit_count, peers = self.candidates, self.buckets, geometry.bit_count, geometry.peers
+        if self.stats is not None:  # Count the removals up front, keeping the loop below free of bookkeeping
+            self.stats.candidates_removed += sum(1 for peer in peers[target_cell] if candidates[peer] & bit)
+        trail = self.trail
+        if trail is None:
+            for peer in peers[target_cell]:  # Remove possible value from the row, column and block
+                mask = candidates[peer]
+                if mask & bit:
+                    candidates[peer] = mask & ~bit
+                    count = bit_count[mask]
+                    buckets[count].remove(peer)
+                    buckets[count - 1].add(peer)  # Move the peer to the bucket with one value less
+                    if mask == bit:
+                        return False  # Peer has no possible values left, the state is a dead-end
+        else:  # The same loop, logging the old mask of each peer it changes
+            for peer in peers[target_cell]:
+                mask = candidates[peer]
+                if mask & bit:
+                    trail.append((peer, mask))
+                    candidates[peer] = mask & ~bit
+                    count = bit_count[mask]
+                    buckets[count].remove(peer)
+                    buckets[count - 1].add(peer)
+                    if mask == bit:
+                        return False
+        return True
+
+    def assign(self, cell, value):
+        """
+        Places the value in the given position and propagates the constraints to its peers.
+        :param cell: The flat position (row * n^2 + col) to place the given value in.
+        :param value: The value to place in the position.
+        :return: False if a peer is left without any possible values, otherwise True.
+        """
+        self.values[cell] = value
+        if self.trail is not None:
+            self.trail.append((cell, self.candidates[cell]))  # Undoing the mask also empties the position, see undo
+        self.buckets[self.geometry.bit_count[self.candidates[cell]]].discard(cell)  # Filled positions aren't indexed
+        self.candidates[cell] = 0  # Position has been filled so it no longer has possible moves
+        return self.update_constraints(cell, value)
+
+    def eliminate(self, cell, bits):
+        """
+        Removes the given values from the candidate mask of an empty position, moving it to the matching bucket.
+        At least one of the values must be a candidate of the position.
+        :param cell: The flat position (row * n^2 + col) to update.
+        :param bits: Mask of the values to remove.
+        :return: False if the position is left without any possible values, otherwise True.
+        """
+        mask, bit_count = self.candidates[cell], self.geometry.bit_count
+        new_mask = mask & ~bits
+        if self.stats is not None:
+            self.stats.candidates_removed += bit_count[mask] - bit_count[new_mask]
+        if self.trail is not None:
+            self.trail.append((cell, mask))
+        self.candidates[cell] = new_mask
+        self.buckets[bit_count[mask]].remove(cell)
+        self.buckets[bit_count[new_mask]].add(cell)
+        return new_mask != 0
+
+    def propagate(self, level=PROPAGATION_NAKED_SINGLES):
+        """
+        Runs the propagation pipeline of the given level until no stage changes the board.
+        Each stage runs until it finds nothing more to do. Whenever a later (more expensive) stage makes a change, the
+        pipeline starts again from the first stage.
+        :param level: The propagation level (PROPAGATION_NONE, ..., PROPAGATION_PAIRS).
+        :return: False if the board was found to have no solution, otherwise True.
+        """
+        if self.buckets[0]:
+            return False  # A position has already run out of possible values
+        stages = PROPAGATION_STAGES[level]
+        stage = 0
+        while stage < len(stages):
+            changes = stages[stage](self)
+            if changes == CONTRADICTION:
+                return False
+            stage = 0 if changes and stage else stage + 1  # Start again from the first stage after a change
+        return True
+
+    def propagate_naked_singles(self):
+        """
+        Repeatedly assigns the empty positions that have only one possible value, until none are left.
+        Drains the singleton bucket, which each assignment refills with the peers it reduces to a single value.
+        :return: The number of assignments made, or CONTRADICTION.
+        """
+        singletons, mask_values = self.buckets[1], self.geometry.mask_values  # Worklist of the singleton positions
+        changes = 0
+        while singletons:
+            cell = singletons.pop()  # Get singleton's position
+            if not self.assign(cell, mask_values[self.candidates[cell]][0]):  # Propagate constraints
+                return CONTRADICTION
+            changes += 1
+        if self.stats is not None:
+            self.stats.singles += changes
+        return changes
+
+    def propagate_hidden_singles(self):
+        """
+        Repeatedly assigns the values that only one position of a row, column or block can take, until none are left.
+        :return: The number of assignments made, or CONTRADICTION.
+        """
+        candidates, used, geometry = self.candidates, (self.row_used, self.col_used, self.box_used), self.geometry
+        size, full_mask, mask_values = geometry.size, geometry.full_mask, geometry.mask_values
+        changes, found = 0, True
+        while found:
+            found = False
+            for unit, cells in enumerate(geometry.units):
+                once = twice = 0  # Values possible in at least one / at least two positions of the unit
+                for cell in cells:
+                    mask = candidates[cell]
+                    twice |= once & mask
+                    once |= mask
+                if (once | used[unit // size][unit % size]) != full_mask:
+                    return CONTRADICTION  # A value can't be placed anywhere in the unit
+                hidden = once & ~twice
+                if not hidden:
+                    continue
+                for cell in cells:
+                    bit = candidates[cell] & hidden
+                    if bit:
+                        if bit & (bit - 1):
+                            return CONTRADICTION  # The position is the only place for two values
+                        if not self.assign(cell, mask_values[bit][0]):
+                            return CONTRADICTION
+                        changes, found = changes + 1, True
+        if self.stats is not None:
+            self.stats.singles += changes
+        return changes
+
+    def propagate_locked_candidates(self):
+        """
+        Applies pointing and claiming until nothing changes. If the positions of a block that can take a value all lie
+        on one row or column, the value is removed from the rest of that row or column (pointing), and if the positions
+        of a row or column that can take a value all lie in one block, it is removed from the rest of the block
+        (claiming).
+        :return: The number of positions changed, or CONTRADICTION.
+        """
+        candidates = self.candidates
+        changes, found = 0, True
+        while found:
+            found = False
+            for shared, box_rest, line_rest in self.geometry.intersections:
+                shared_mask = 0
+                for cell in shared:
+                    shared_mask |= candidates[cell]
+                if not shared_mask:
+                    continue
+                box_mask = line_mask = 0
+                for cell in box_rest:
+                    box_mask |= candidates[cell]
+                for cell in line_rest:
+                    line_mask |= candidates[cell]
+                for bits, rest in ((shared_mask & ~box_mask & line_mask, line_rest),
+                                   (shared_mask & ~line_mask & box_mask, box_rest)):
+                    if bits:
+                        for cell in rest:
+                            if candidates[cell] & bits:
+                                if not self.eliminate(cell, bits):
+                                    return CONTRADICTION
+                                changes, found = changes + 1, True
+        return changes
+
+    def propagate_naked_pairs(self):
+        """
+        Applies naked pairs until nothing changes. If two positions of a row, column or block can only take the same
+        two values, those values are removed from the rest of the unit.
+        :return: The number of positions changed, or CONTRADICTION.
+        """
+        candidates, bit_count = self.candidates, self.geometry.bit_count
+        changes, found = 0, True
+        while found:
+            found = False
+            for cells in self.geometry.units:
+                pairs = {}  # Holds the first position (value) of each two value mask (key)
+                for cell in cells:
+                    mask = candidates[cell]
+                    if bit_count[mask] != 2:
+                        continue
+                    if mask not in pairs:
+                        pairs[mask] = cell
+                        continue
+                    for other in cells:
+                        if other != cell and other != pairs[mask] and candidates[other] & mask:
+                            if not self.eliminate(other, mask):
+                                return CONTRADICTION
+                            changes, found = changes + 1, True
+        return changes
+
+    def propagate_hidden_pairs(self):
+        """
+        Applies hidden pairs until nothing changes. If two values of a row, column or block can only be placed in the
+        same two positions, every other value is removed from those positions.
+        :return: The number of positions changed, or CONTRADICTION.
+        """
+        candidates, geometry = self.candidates, self.geometry
+        bit_count, mask_values, size = geometry.bit_count, geometry.mask_values, geometry.size
+        changes, found = 0, True
+        while found:
+            found = False
+            for cells in geometry.units:
+                positions = [0] * (size + 1)  # Holds a mask of the positions of the unit that can take each value
+                for i, cell in enumerate(cells):
+                    for value in mask_values[candidates[cell]]:
+                        positions[value] |= 1 << i
+                pairs = {}  # Holds the first value (value) placed in each pair of positions (key)
+                for value in range(1, size + 1):
+                    if bit_count[positions[value]] != 2:
+                        continue
+                    if positions[value] not in pairs:
+                        pairs[positions[value]] = value
+                        continue
+                    keep = (1 << (value - 1)) | (1 << (pairs[positions[value]] - 1))
+                    removed = changes
+                    for i in mask_values[positions[value]]:
+                        cell = cells[i - 1]
+                        if candidates[cell] & ~keep:
+                            if not self.eliminate(cell, ~keep & geometry.full_mask):
+                                return CONTRADICTION
+                            changes, found = changes + 1, True
+                    if changes != removed:
+                        break  # The eliminations made positions stale, the unit is scanned again on the next pass
+        return changes
+
+    def undo(self, mark):
+        """
+        Rolls the state back, in place, to the point where its trail had mark entries, undoing every assignment and
+        candidate removal logged since (see trail). Only the earliest logged mask of each changed position is restored,
+        and each position is moved to its bucket once. The positions that hold a value are exactly the ones assigned
+        since the mark (filled positions have no candidates to change), so they are emptied again.
+        :param mark: The length of the trail to roll back to.
         :return: None
         """
-        for i in range(9):
-            if value in self.possible_values[target_row][i]:  # Update the column
-                self.possible_values[target_row][i].remove(value)
-            if value in self.possible_values[i][target_col]:  # Update the row
-                self.possible_values[i][target_col].remove(value)
-
-        # Update the block:
-        block_row = target_row - (target_row % 3)
-        block_col = target_col - (target_col % 3)
-        for row in range(3):
-            for col in range(3):
-                if value in self.possible_values[block_row + row][block_col + col]:  # Remove possible value from block
-                    self.possible_values[block_row + row][block_col + col].remove(value)
+        trail, values, candidates, buckets = self.trail, self.values, self.candidates, self.buckets
+        geometry = self.geometry
+        bit_count = geometry.bit_count
+        for cell, mask in dict(reversed(trail[mark:])).items():  # The earliest old mask of each position wins
+            value = values[cell]
+            if value:  # Assigned since the mark, remove the value from the used masks
+                values[cell] = 0
+                bit = ~(1 << (value - 1))
+                self.row_used[geometry.cell_row[cell]] &= bit
+                self.col_used[geometry.cell_col[cell]] &= bit
+                self.box_used[geometry.cell_box[cell]] &= bit
+            else:
+                buckets[bit_count[candidates[cell]]].remove(cell)
+            candidates[cell] = mask
+            buckets[bit_count[mask]].add(cell)
+        del trail[mark:]
         return
 
     def copy_state(self):
         """
-        Creates and returns a copy of the current state. Copies the final_values and possible_values of the object.
+        Creates and returns a copy of the current state. Copies the board values and masks of the object.
         Used to overcome the overheads associated with __deepcopy__.
         :return: A copy of the current state (SudokuState object).
         """
-        new_state = SudokuState(np.ndarray.copy(self.final_values))  # Copy final values using numpy's built-in copy
-        for (row, col), values in np.ndenumerate(self.possible_values):
-            new_state.possible_values[row][col] = values[:]  # Copy over each list of possible values
+        new_state = SudokuState.__new__(SudokuState)  # Skip __init__, the arrays are copied over directly
+        new_state.geometry = self.geometry
+        new_state.values = self.values[:]
+        new_state.candidates = self.candidates[:]
+        new_state.row_used = self.row_used[:]
+        new_state.col_used = self.col_used[:]
+        new_state.box_used = self.box_used[:]
+        new_state.buckets = [bucket.copy() for bucket in self.buckets]
+        new_state.stats = self.stats
         return new_state  # Return a SudokuState with the copied values
 
-    def gen_next_state(self, row, col, value):
+    def gen_next_state(self, cell, value, level=PROPAGATION_NAKED_SINGLES):
         """
-        Generates the board configuration after we place the given value in position (row, col). Places the value in
+        Generates the board configuration after we place the given value in the given position. Places the value in
         the specified position, iterates through the affected positions and updates their constraints.
-        :param row: The row to place the given value in.
-        :param col: The column to place the given value in.
-        :param value: The value to place in the row, col.
-        :return: The generated board state after placing the given value in the specified row, col.
+        If the state has a SolverStats object, the time spent copying and propagating is added to it.
+        :param cell: The flat position (row * n^2 + col) to place the given value in.
+        :param value: The value to place in the position.
+        :param level: The propagation level applied after the assignment, see propagate.
+        :return: The generated board state after placing the given value in the specified position, or None if the
+        assignment or propagation found that it has no solution.
         """
+        if self.stats is not None:
+            start_time = time.perf_counter()
         new_state = self.copy_state()  # Create a copy of the current state (final and possible values)
-        # Update the board configuration:
-        new_state.final_values[row][col] = value
-        new_state.possible_values[row][col] = []  # Position has been filled so it no longer has possible moves
-
-        new_state.update_constraints(row, col, value)  # Update affected possible values (apply constraints)
-
-        singleton_list = new_state.get_singletons()  # Find singletons for the new board configuration
-        while singleton_list:
-            row, col = singleton_list.pop()  # Get singleton's position
-
-            new_state.final_values[row][col] = new_state.possible_values[row][col][0]  # Update final value
-            new_state.possible_values[row][col] = []  # Position has been filled so it no longer has possible moves
-            new_state.update_constraints(row, col, new_state.final_values[row][col])  # Propagate constraints
+        if self.stats is not None:
+            copy_time = time.perf_counter()
+            self.stats.time_copy += copy_time - start_time
+        # Update the board configuration and apply constraints, then further inference (e.g. assign singletons):
+        consistent = new_state.assign(cell, value) and new_state.propagate(level)
+        if self.stats is not None:
+            self.stats.time_propagation += time.perf_counter() - copy_time
+        return new_state if consistent else None  # Return the resulting state, unless it is a dead-end
 
-            singleton_list = new_state.get_singletons()  # Get the remaining singletons
 
-        return new_state  # Return the resulting state
+# The stages run by SudokuState.propagate for each propagation level, cheapest first:
+PROPAGATION_STAGES = (
+    (),  # PROPAGATION_NONE
+    (SudokuState.propagate_naked_singles,),  # PROPAGATION_NAKED_SINGLES
+    (SudokuState.propagate_naked_singles, SudokuState.propagate_hidden_singles),  # PROPAGATION_HIDDEN_SINGLES
+    (SudokuState.propagate_naked_singles, SudokuState.propagate_hidden_singles,
+     SudokuState.propagate_locked_candidates, SudokuState.propagate_naked_pairs,
+     SudokuState.propagate_hidden_pairs),  # PROPAGATION_PAIRS
+)
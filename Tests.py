@@ -1,6 +1,16 @@
+import asyncio
+import async_solver
+import batch
+import cache
+import dataset
 import main
+import os
+import parallel
 import time
+import validator
 import numpy as np
+from SolverStats import SolverStats
+from SudokuState import PROPAGATION_NONE, PROPAGATION_NAKED_SINGLES, PROPAGATION_HIDDEN_SINGLES, PROPAGATION_PAIRS
 
 
 # Provided testing code, from University of Bath
@@ -50,40 +60,66 @@ def run_tests(difficulties=None):
     print("THE ENTIRE SOLUTION TAKES: ", very_end_time-very_start_time, " seconds")
 
 
+def load_extra_tests(csv_path="data/sudoku.csv", dataset_path="data/sudoku.sdk"):
+    """
+    Loads the puzzles and solutions of the extra tests (data/sudoku.csv).
+    The CSV is converted into the binary dataset format the first time, later runs memory-map the converted file. The
+    converted file is used on its own when the CSV is missing.
+    :param csv_path: Path to the CSV file of the extra tests.
+    :param dataset_path: Path of the converted binary file.
+    :return: The quizzes and solutions, as (N, 9, 9) memory-mapped numpy arrays.
+    """
+    if not os.path.exists(dataset_path) or \
+            os.path.exists(csv_path) and os.path.getmtime(dataset_path) < os.path.getmtime(csv_path):
+        dataset.convert_csv(csv_path, dataset_path)
+    quizzes, solutions, _ = dataset.open_dataset(dataset_path)
+    return quizzes, solutions
+
+
+def print_invalid_solutions(quizzes, your_solutions):
+    """
+    Checks a batch of solutions with the vectorized validator, printing the number of valid solutions and the
+    offending units of the first invalid one.
+    The extra tests have a unique solution for every quiz, so a valid solution that keeps the givens is the solution.
+    :param quizzes: (N, 9, 9) numpy array of the quizzes.
+    :param your_solutions: (N, 9, 9) numpy array of their solutions.
+    :return: The number of valid solutions.
+    """
+    statuses, bad_units = validator.validate_solutions(quizzes, your_solutions)
+    invalid = np.flatnonzero(statuses != validator.STATUS_VALID)
+    print("Correct solutions: ", len(quizzes) - len(invalid), "/", len(quizzes))
+    if len(invalid):
+        units = [("row", "column", "block")[unit // 9] + f" {unit % 9}"
+                 for unit in np.flatnonzero(bad_units[invalid[0]])]
+        print(f"Wrong solution (status {statuses[invalid[0]]}) for: ", quizzes[invalid[0]])
+        print("Offending units: ", ", ".join(units))
+    return len(quizzes) - len(invalid)
+
+
 def extra_tests():
     """
     Extra tests to make sure the current approach is indeed correct.
     :return:
     """
-    quizzes = np.zeros((1000000, 81), np.int32)
-    solutions = np.zeros((1000000, 81), np.int32)
-    for i, line in enumerate(open('data/sudoku.csv', 'r').read().splitlines()[1:]):
-        quiz, solution = line.split(",")
-        for j, q_s in enumerate(zip(quiz, solution)):
-            q, s = q_s
-            quizzes[i, j] = q
-            solutions[i, j] = s
-    quizzes = quizzes.reshape((-1, 9, 9))
-    solutions = solutions.reshape((-1, 9, 9))
+    quizzes, _ = load_extra_tests()
     print("Size: ", quizzes.size)
     puzzles_num = 10000
+    quizzes = quizzes[:puzzles_num]
+    your_solutions = np.empty(quizzes.shape, dtype=int)
     times, count = 0, 0
     very_start_time = time.process_time()
-    for quiz, solution in zip(quizzes[:puzzles_num], solutions[:puzzles_num]):
+    for quiz in quizzes:
 
         # print(quiz)
         start_time = time.process_time()
-        your_solution = main.sudoku_solver(quiz.copy())
+        your_solutions[count] = main.sudoku_solver(quiz.copy())
         end_time = time.process_time()
 
         times += end_time-start_time
         count += 1
-        # print(your_solution)
-        if not np.array_equal(your_solution, solution):
-            print("Wrong solution for: ", quiz)
-            break
         # print("Time to solve: ", end_time-start_time, " seconds")
 
+    print_invalid_solutions(quizzes, your_solutions)  # Checks every solution in one vectorized pass
     very_end_time = time.process_time()
     print("===========================\n")
     print("THE ENTIRE SOLUTION TAKES: ", very_end_time-very_start_time, " seconds")
@@ -92,11 +128,208 @@ def extra_tests():
     pass
 
 
+def parallel_tests(worker_counts=(1, 2, 4, 8, 16, 32), quizzes=None):
+    """
+    Solves the extra tests in parallel, checks the solutions and prints the speedup for each number of workers.
+    The curve is printed as a markdown table, headed by the board and CPU counts it was measured with, so it can be
+    pasted into the readme. Worker counts above the CPU count only measure the cost of oversubscribing the machine.
+    :param worker_counts: The numbers of worker processes to measure.
+    :param quizzes: Optional (N, 9, 9) puzzles to measure instead of the extra tests.
+    :return:
+    """
+    if quizzes is None:
+        quizzes, _ = load_extra_tests()
+    your_solutions = parallel.sudoku_solver_parallel(quizzes, workers=worker_counts[-1])
+    print_invalid_solutions(quizzes, your_solutions)
+    print("===========================\n")
+    print(f"{len(quizzes)} boards, {os.cpu_count()} CPUs\n")
+    print("| Workers | Seconds | Speedup |")
+    print("|---|---|---|")
+    for workers, seconds, speedup in parallel.speedup_curve(quizzes, worker_counts):
+        oversubscribed = " (more workers than CPUs)" if workers > os.cpu_count() else ""
+        print(f"| {workers} | {seconds:.2f} | {speedup:.2f}x{oversubscribed} |")
+
+
+def propagation_tests(difficulties=None, engine="dfs"):
+    """
+    Solves every sudoku with each propagation level, printing the nodes expanded and solve times per level.
+    Used to pick the cheapest propagation level that still keeps the search small on hard boards.
+    :param difficulties: The difficulties to test, defaults to all of them.
+    :param engine: The search used to solve the puzzles, see main.ENGINES.
+    :return:
+    """
+    if difficulties is None:
+        difficulties = ['very_easy', 'easy', 'medium', 'hard']
+
+    levels = {"none": PROPAGATION_NONE, "naked singles": PROPAGATION_NAKED_SINGLES,
+              "hidden singles": PROPAGATION_HIDDEN_SINGLES, "pairs": PROPAGATION_PAIRS}
+    for difficulty in difficulties:
+        print(f"Testing {difficulty} sudokus")
+        sudokus = np.load(f"data/{difficulty}_puzzle.npy")
+        solutions = np.load(f"data/{difficulty}_solution.npy")
+
+        for name, level in levels.items():
+            nodes, times, count = [], [], 0
+            for sudoku, solution in zip(sudokus, solutions):
+                stats = SolverStats()
+                start_time = time.process_time()
+                your_solution = main.sudoku_solver(sudoku.copy(), engine=engine, propagation=level, stats=stats)
+                times.append(time.process_time() - start_time)
+                nodes.append(stats.nodes)
+                count += np.array_equal(your_solution, solution)
+            print(f"{name:>15}: {count}/{len(sudokus)} correct, nodes mean {np.mean(nodes):.1f} max {max(nodes)}, "
+                  f"time median {np.median(times):.5f} max {max(times):.5f} seconds")
+        print()
+
+
+def engine_tests(difficulties=None, propagation=None):
+    """
+    Solves every sudoku with each solver engine, printing the nodes expanded and solve times per engine.
+    :param difficulties: The difficulties to test, defaults to all of them.
+    :param propagation: The propagation level used by the engines, see SudokuState.propagate. Defaults to the level
+    sudoku_solver picks for the board size.
+    :return:
+    """
+    if difficulties is None:
+        difficulties = ['very_easy', 'easy', 'medium', 'hard']
+
+    for difficulty in difficulties:
+        print(f"Testing {difficulty} sudokus")
+        sudokus = np.load(f"data/{difficulty}_puzzle.npy")
+        solutions = np.load(f"data/{difficulty}_solution.npy")
+
+        for engine in main.ENGINES:
+            nodes, times, count = [], [], 0
+            for sudoku, solution in zip(sudokus, solutions):
+                stats = SolverStats()
+                start_time = time.process_time()
+                your_solution = main.sudoku_solver(sudoku.copy(), engine=engine, propagation=propagation, stats=stats)
+                times.append(time.process_time() - start_time)
+                nodes.append(stats.nodes)
+                count += np.array_equal(your_solution, solution)
+            print(f"{engine:>15}: {count}/{len(sudokus)} correct, nodes mean {np.mean(nodes):.1f} max {max(nodes)}, "
+                  f"time median {np.median(times):.5f} max {max(times):.5f} seconds")
+        print()
+
+
+def profile_tests(difficulties=None, engine="dfs", propagation=None):
+    """
+    Solves every sudoku with search instrumentation on, printing the totals of the search counters and where the solve
+    time went (heuristics, propagation and copying) for each difficulty.
+    :param difficulties: The difficulties to test, defaults to all of them.
+    :param engine: The search used to solve the puzzles, see main.ENGINES.
+    :param propagation: The propagation level used by the engine, see SudokuState.propagate. Defaults to the level
+    sudoku_solver picks for the board size.
+    :return:
+    """
+    if difficulties is None:
+        difficulties = ['very_easy', 'easy', 'medium', 'hard']
+
+    for difficulty in difficulties:
+        sudokus = np.load(f"data/{difficulty}_puzzle.npy")
+        totals = {}
+        for sudoku in sudokus:
+            stats = SolverStats()
+            main.sudoku_solver(sudoku.copy(), engine=engine, propagation=propagation, stats=stats)
+            for name, value in stats.as_dict().items():
+                totals[name] = max(totals.get(name, 0), value) if name == "max_depth" else totals.get(name, 0) + value
+        print(f"{difficulty:>10}: nodes {totals['nodes']}, backtracks {totals['backtracks']}, "
+              f"max depth {totals['max_depth']}, singles {totals['singles']}, "
+              f"candidates removed {totals['candidates_removed']}")
+        print(f"{'':>10}  heuristic {totals['time_heuristic']:.5f}, propagation {totals['time_propagation']:.5f}, "
+              f"copy {totals['time_copy']:.5f} seconds")
+
+
+def limit_tests(difficulties=None, max_nodes=50, workers=None):
+    """
+    Solves every sudoku asynchronously (see async_solver) with a node limit, printing how many were solved correctly
+    and how many reached the limit and gave up.
+    :param difficulties: The difficulties to test, defaults to all of them.
+    :param max_nodes: The number of nodes the search of each board may expand.
+    :param workers: The number of worker processes, defaults to the number of CPUs.
+    :return:
+    """
+    if difficulties is None:
+        difficulties = ['very_easy', 'easy', 'medium', 'hard']
+
+    for difficulty in difficulties:
+        sudokus = np.load(f"data/{difficulty}_puzzle.npy")
+        solutions = np.load(f"data/{difficulty}_solution.npy")
+        results = asyncio.run(async_solver.solve_many_async(sudokus, workers=workers, max_nodes=max_nodes))
+        gave_up = sum(isinstance(result, main.SolverGaveUp) for result in results)
+        count = sum(np.array_equal(result, solution) for result, solution in zip(results, solutions)
+                    if not isinstance(result, Exception))
+        print(f"{difficulty:>10}: {count}/{len(sudokus)} correct, {gave_up} gave up after {max_nodes} nodes")
+
+
+def uniqueness_tests(difficulties=None):
+    """
+    Checks which sudokus have a unique solution, board by board (main.count_solutions) and through the batch path
+    (batch.count_solutions_batch), printing the counts of each difficulty and the time each path took.
+    :param difficulties: The difficulties to test, defaults to all of them.
+    :return:
+    """
+    if difficulties is None:
+        difficulties = ['very_easy', 'easy', 'medium', 'hard']
+
+    for difficulty in difficulties:
+        sudokus = np.load(f"data/{difficulty}_puzzle.npy")
+        start_time = time.process_time()
+        counts = [main.count_solutions(sudoku) for sudoku in sudokus]
+        single_time = time.process_time() - start_time
+        start_time = time.process_time()
+        batch_counts = batch.count_solutions_batch(sudokus)
+        batch_time = time.process_time() - start_time
+        print(f"{difficulty:>10}: {counts.count(1)}/{len(sudokus)} unique, {counts.count(0)} with no solution, "
+              f"batch counts {'match' if batch_counts.tolist() == counts else 'differ'}, "
+              f"{single_time:.5f} seconds single, {batch_time:.5f} seconds batch")
+
+
+def cache_tests(difficulties=None, repeats=3):
+    """
+    Solves every sudoku several times through a SolutionCache, each time after a random relabelling, line swaps and
+    transposition, then prints the cache's hit rate and mean lookup time.
+    :param difficulties: The difficulties to test, defaults to all of them.
+    :param repeats: The number of transformed copies of each sudoku to solve.
+    :return:
+    """
+    if difficulties is None:
+        difficulties = ['very_easy', 'easy', 'medium', 'hard']
+
+    rng = np.random.default_rng(0)
+    solution_cache = cache.SolutionCache()
+    count, total = 0, 0
+    for difficulty in difficulties:
+        sudokus = np.load(f"data/{difficulty}_puzzle.npy")
+        solutions = np.load(f"data/{difficulty}_solution.npy")
+        for sudoku, solution in zip(sudokus, solutions):
+            for _ in range(repeats):
+                digits = np.concatenate(([0], rng.permutation(9) + 1))
+                rows = np.concatenate([band * 3 + rng.permutation(3) for band in rng.permutation(3)])
+                cols = np.concatenate([stack * 3 + rng.permutation(3) for stack in rng.permutation(3)])
+                transform = (lambda board: board[rows][:, cols].T) if rng.random() < 0.5 else \
+                    (lambda board: board[rows][:, cols])
+                expected = transform(digits[solution.astype(int)]) if solution[0, 0] != -1 else solution
+                count += np.array_equal(solution_cache(transform(digits[sudoku])), expected)
+                total += 1
+
+    print(f"{count}/{total} sudokus correct")
+    print(f"Hit rate: {solution_cache.hit_rate:.3f}, mean lookup time: {solution_cache.mean_lookup_time * 1e6:.1f} us")
+
+
 if __name__ == "__main__":
     d = ["hard"]
     # run_tests(d)
     run_tests()
     # extra_tests()
+    # parallel_tests()
+    # propagation_tests()
+    # engine_tests()
+    # engine_tests(["16x16", "25x25"])
+    # profile_tests()
+    # limit_tests()
+    # uniqueness_tests()
+    # cache_tests()
     # s = np.full(shape=(9,9), fill_value=9, dtype=int)
     # solutions = np.load("data/very_easy_solution.npy")
     # print(main.sudoku_solver(solutions[0]))
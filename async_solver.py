@@ -0,0 +1,135 @@
+import asyncio
+import functools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import main
+import numpy as np
+
+
+class AsyncSolver:
+    """
+    Solves Sudoku puzzles from an asyncio event loop in a pool of worker processes, so the loop never blocks on a
+    solve. At most max_pending solves are queued or running at a time, further solves wait for a free slot before their
+    board is sent to the pool (backpressure).
+    Cancelling a solve that is still queued removes it from the pool. A solve that already started can't be stopped
+    from the loop, its timeout and max_nodes limits (see main.sudoku_solver) bound how long it keeps its worker busy.
+    """
+    def __init__(self, workers=None, max_pending=None, **solver_args):
+        """
+        Creates an AsyncSolver Object and its pool of worker processes.
+        :param workers: The number of worker processes, defaults to the number of CPUs.
+        :param max_pending: The maximum number of solves queued or running at a time, defaults to twice the workers.
+        :param solver_args: Arguments passed on to main.sudoku_solver (e.g. engine, propagation).
+        """
+        self.workers = workers or os.cpu_count()
+        self.solver_args = solver_args
+        self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        self.slots = asyncio.Semaphore(max_pending or self.workers * 2)  # One slot per solve queued or running
+        self.futures = set()  # The pool's futures of the solves queued or running, cancelled by close
+
+    async def submit(self, sudoku, timeout=None, max_nodes=None):
+        """
+        Sends a board to the pool, first waiting for a free slot if max_pending solves are queued or running.
+        :param sudoku: nxn numpy array, empty cells are designated by 0.
+        :param timeout: Optional number of seconds the search may run for, not counting the time spent queued.
+        :param max_nodes: Optional number of nodes the search may expand.
+        :return: Future of the result of main.sudoku_solver, cancelling it removes the solve from the pool if it hasn't
+        started yet.
+        """
+        await self.slots.acquire()
+        loop = asyncio.get_running_loop()
+        try:
+            future = self.executor.submit(main.sudoku_solver, np.asarray(sudoku), timeout=timeout,
+                                          max_nodes=max_nodes, **self.solver_args)
+        except BaseException:
+            self.slots.release()
+            raise
+
+        def release(_):
+            self.futures.discard(future)
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(self.slots.release)  # Done callbacks run on the pool's threads
+
+        self.futures.add(future)
+        future.add_done_callback(release)
+        return asyncio.wrap_future(future)
+
+    async def solve(self, sudoku, timeout=None, max_nodes=None):
+        """
+        Solves a Sudoku puzzle in the pool.
+        :param sudoku: nxn numpy array, empty cells are designated by 0.
+        :param timeout: Optional number of seconds the search may run for, not counting the time spent queued.
+        :param max_nodes: Optional number of nodes the search may expand.
+        :return: The solution, or an array of -1 if there is none (see main.sudoku_solver).
+        :raises SolverGaveUp: If the search reached the timeout or max_nodes limit first.
+        """
+        return await (await self.submit(sudoku, timeout, max_nodes))
+
+    async def solve_many(self, sudokus, timeout=None, max_nodes=None):
+        """
+        Solves several Sudoku puzzles in the pool. Boards are taken from sudokus as slots become free, so it may be a
+        generator of boards that are not all held in memory.
+        :param sudokus: Iterable of nxn numpy arrays, empty cells are designated by 0.
+        :param timeout: Optional number of seconds the search of each board may run for.
+        :param max_nodes: Optional number of nodes the search of each board may expand.
+        :return: List of results in input order, each the solution (see main.sudoku_solver) or the exception raised
+        for that board, e.g. SolverGaveUp if its search reached a limit.
+        """
+        futures = []
+        try:
+            for sudoku in sudokus:
+                futures.append(await self.submit(sudoku, timeout, max_nodes))
+            return await asyncio.gather(*futures, return_exceptions=True)
+        except BaseException:
+            for future in futures:
+                future.cancel()  # Removes the solves that haven't started from the pool
+            raise
+
+    async def close(self):
+        """
+        Shuts the pool down, cancelling the solves that haven't started and waiting for the running ones to finish.
+        :return: None
+        """
+        for future in list(self.futures):  # A copy, as the done callbacks remove the futures from the pool's threads
+            future.cancel()  # Only succeeds for the solves that haven't started
+        await asyncio.get_running_loop().run_in_executor(None, functools.partial(self.executor.shutdown, wait=True))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+async def solve_async(sudoku, solver, timeout=None, max_nodes=None):
+    """
+    Solves a Sudoku puzzle without blocking the event loop, in the worker processes of the given AsyncSolver. The
+    solver is required rather than defaulting to the loop's thread pool, where a solve would hold the GIL (stalling the
+    loop) with no bound on the pending solves and no way to cancel them. Services should create one AsyncSolver and
+    share it between their requests.
+    :param sudoku: nxn numpy array, empty cells are designated by 0.
+    :param solver: The AsyncSolver to solve the board in, its solver_args are passed on to main.sudoku_solver.
+    :param timeout: Optional number of seconds the search may run for, not counting the time spent queued.
+    :param max_nodes: Optional number of nodes the search may expand.
+    :return: The solution, or an array of -1 if there is none (see main.sudoku_solver).
+    :raises SolverGaveUp: If the search reached the timeout or max_nodes limit first.
+    """
+    return await solver.solve(sudoku, timeout, max_nodes)
+
+
+async def solve_many_async(sudokus, workers=None, max_pending=None, timeout=None, max_nodes=None, **solver_args):
+    """
+    Solves several Sudoku puzzles without blocking the event loop, in a pool of worker processes created for the call
+    (see AsyncSolver).
+    :param sudokus: Iterable of nxn numpy arrays, empty cells are designated by 0.
+    :param workers: The number of worker processes, defaults to the number of CPUs.
+    :param max_pending: The maximum number of solves queued or running at a time, defaults to twice the workers.
+    :param timeout: Optional number of seconds the search of each board may run for.
+    :param max_nodes: Optional number of nodes the search of each board may expand.
+    :param solver_args: Arguments passed on to main.sudoku_solver (e.g. engine, propagation).
+    :return: List of results in input order, each the solution or the exception raised for that board (see
+    AsyncSolver.solve_many).
+    """
+    async with AsyncSolver(workers, max_pending, **solver_args) as solver:
+        return await solver.solve_many(sudokus, timeout, max_nodes)
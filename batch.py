@@ -0,0 +1,156 @@
+import main
+import numpy as np
+from SudokuState import CELL_BOX, CELL_COL, CELL_ROW, UNITS
+
+# Index tables used to gather a (N, 81, 9) candidate tensor into its units and back into each cell's units.
+UNIT_CELLS = np.array(UNITS, dtype=np.intp)  # (27, 9) cells of each row, column and block
+CELL_UNITS = np.array([(CELL_ROW[cell], 9 + CELL_COL[cell], 18 + CELL_BOX[cell]) for cell in range(81)],
+                      dtype=np.intp)  # (81, 3) row, column and block unit of each cell
+DIGITS = np.arange(1, 10, dtype=np.int8)  # The values 1 - 9, one per candidate plane
+
+
+def one_hot(values):
+    """
+    Converts flat boards into a one-hot tensor of their placed values.
+    :param values: (N, 81) numpy array of boards with values in range (0, 9).
+    :return: (N, 81, 9) boolean numpy array, True where the cell holds the value of that plane.
+    """
+    return values[:, :, None] == DIGITS
+
+
+def unit_counts(planes):
+    """
+    Counts, for each unit (row, column and block) of each board, how many of its cells are set in each value plane.
+    :param planes: (N, 81, 9) boolean numpy array (placed values or candidates).
+    :return: (N, 27, 9) numpy array of counts, units ordered as rows, columns then blocks.
+    """
+    return planes[:, UNIT_CELLS, :].sum(axis=2, dtype=np.int8)
+
+
+def init_candidates(values):
+    """
+    Initializes the candidates of every cell of every board, according to the values placed in its units.
+    :param values: (N, 81) numpy array of boards with values in range (0, 9).
+    :return: (N, 81, 9) boolean numpy array, True where the value is possible for an empty cell.
+    """
+    used = unit_counts(one_hot(values)) > 0  # (N, 27, 9) values placed in each unit
+    cell_used = used[:, CELL_UNITS, :].any(axis=2)  # (N, 81, 9) values placed in the units of each cell
+    return ~cell_used & (values == 0)[:, :, None]
+
+
+def propagate(values, candidates):
+    """
+    Applies naked and hidden single propagation to a batch of boards, in place, until no board changes.
+    A naked single is an empty cell with one candidate, a hidden single is a value that only one cell of a unit can
+    take. Boards that are solved or shown to be unsolvable are dropped from the working set as soon as possible.
+    :param values: (N, 81) numpy array of boards with values in range (0, 9). Updated in place.
+    :param candidates: (N, 81, 9) boolean candidates, as returned by init_candidates. Updated in place.
+    :return: (N,) boolean numpy array, True for the boards that were found to have no solution.
+    """
+    dead = np.zeros(len(values), dtype=bool)
+    active = np.flatnonzero((values == 0).any(axis=1))  # Boards that still have empty cells
+    while len(active):
+        board_values, board_candidates = values[active], candidates[active]
+        empty = board_values == 0
+        cell_counts = board_candidates.sum(axis=2)
+        candidate_counts = unit_counts(board_candidates)  # (M, 27, 9) cells of each unit that can take each value
+        placed = unit_counts(one_hot(board_values)) > 0
+
+        stuck = (empty & (cell_counts == 0)).any(axis=1)  # An empty cell has no possible values
+        stuck |= ((candidate_counts == 0) & ~placed).any(axis=(1, 2))  # A value can't be placed anywhere in a unit
+
+        # Naked singles, then hidden singles (candidates that are the only one for their value in one of their units):
+        singles = board_candidates & (cell_counts == 1)[:, :, None]
+        singles |= board_candidates & (candidate_counts == 1)[:, CELL_UNITS, :].any(axis=2)
+        single_counts = singles.sum(axis=2)
+        stuck |= (single_counts > 1).any(axis=1)  # A cell is the only place for two different values
+
+        assigned = single_counts == 1
+        board_values[assigned] = singles[assigned].argmax(axis=1) + 1
+        placed_counts = unit_counts(one_hot(board_values))
+        stuck |= (placed_counts > 1).any(axis=(1, 2))  # Two singles placed the same value in one unit
+        board_candidates &= ~(placed_counts > 0)[:, CELL_UNITS, :].any(axis=2)
+        board_candidates &= (board_values == 0)[:, :, None]
+
+        values[active], candidates[active] = board_values, board_candidates
+        dead[active[stuck]] = True
+        keep = ~stuck & assigned.any(axis=1) & (board_values == 0).any(axis=1)  # Changed, and not solved or stuck
+        active = active[keep]
+    return dead
+
+
+def sudoku_solver_batch(puzzles, chunk_size=10000, engine="dfs"):
+    """
+    Solves a batch of Sudoku puzzles.
+    Candidate initialisation and naked/hidden single propagation run for a whole chunk of boards at once as numpy
+    operations on a (N, 81, 9) boolean tensor. Only the boards still unsolved after propagation are passed on to
+    sudoku_solver, one at a time.
+
+    Input
+        puzzles : (N, 9, 9) numpy array
+            Empty cells are designated by 0.
+        chunk_size : int
+            The number of boards propagated together, bounding the size of the candidate tensor.
+        engine : str
+            The search used for the boards that propagation doesn't solve, see main.ENGINES.
+
+    Output
+        (N, 9, 9) numpy array of integers
+            It contains the solution of each board, if there is one. Boards with no solution are filled with -1.
+    """
+    puzzles = np.asarray(puzzles).reshape(-1, 81)
+    solutions = np.empty((len(puzzles), 81), dtype=int)
+    for start in range(0, len(puzzles), chunk_size):
+        chunk = puzzles[start:start + chunk_size]
+        invalid = ((chunk < 0) | (chunk > 9)).any(axis=1)  # Values outside the range (0, 9)
+        values = np.where(invalid[:, None], 0, chunk).astype(np.int8)
+        invalid |= (unit_counts(one_hot(values)) > 1).any(axis=(1, 2))  # Duplicates on a row, column or block
+
+        candidates = init_candidates(values)
+        dead = propagate(values, candidates) | invalid
+
+        solved = values.astype(int)
+        for i in np.flatnonzero(~dead & (values == 0).any(axis=1)):  # Search the boards propagation couldn't solve
+            solved[i] = main.sudoku_solver(values[i].reshape(9, 9), engine=engine).ravel()
+        solved[dead] = -1
+        solutions[start:start + len(chunk)] = solved
+    return solutions.reshape(-1, 9, 9)
+
+
+def count_solutions_batch(puzzles, limit=2, chunk_size=10000):
+    """
+    Counts the solutions of a batch of Sudoku puzzles, stopping at limit solutions per board, e.g. to check that every
+    puzzle of a corpus has a unique solution (a count of 1) with the default limit of 2.
+    Candidate initialisation and naked/hidden single propagation run for a whole chunk of boards at once. These only
+    place forced values, so a board solved by propagation has exactly one solution and a board found stuck has none.
+    Only the remaining boards are passed on to main.count_solutions, one at a time.
+
+    Input
+        puzzles : (N, 9, 9) numpy array
+            Empty cells are designated by 0.
+        limit : int
+            The number of solutions (at least 1) to stop at for each board, or None to count every solution.
+        chunk_size : int
+            The number of boards propagated together, bounding the size of the candidate tensor.
+
+    Output
+        (N,) numpy array of integers
+            The number of solutions of each board, at most limit (0 for invalid boards and boards with no solution).
+    """
+    puzzles = np.asarray(puzzles).reshape(-1, 81)
+    counts = np.empty(len(puzzles), dtype=int)
+    for start in range(0, len(puzzles), chunk_size):
+        chunk = puzzles[start:start + chunk_size]
+        invalid = ((chunk < 0) | (chunk > 9)).any(axis=1)  # Values outside the range (0, 9)
+        values = np.where(invalid[:, None], 0, chunk).astype(np.int8)
+        invalid |= (unit_counts(one_hot(values)) > 1).any(axis=(1, 2))  # Duplicates on a row, column or block
+
+        candidates = init_candidates(values)
+        dead = propagate(values, candidates) | invalid
+
+        chunk_counts = np.ones(len(chunk), dtype=int)  # Boards solved by propagation have a single solution
+        for i in np.flatnonzero(~dead & (values == 0).any(axis=1)):  # Search the boards propagation couldn't solve
+            chunk_counts[i] = main.count_solutions(values[i].reshape(9, 9), limit)
+        chunk_counts[dead] = 0
+        counts[start:start + len(chunk)] = chunk_counts
+    return counts
@@ -0,0 +1,274 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import batch
+import dataset
+import main
+import numpy as np
+import parallel
+from SolverStats import SolverStats
+
+DIFFICULTIES = ['very_easy', 'easy', 'medium', 'hard']
+LARGE_SETS = ['16x16', '25x25']  # Boards with 4x4 and 5x5 blocks, only supported by the single entry point
+PERCENTILES = (50, 95, 99)
+# Metrics compared against a baseline, with whether a higher value is better. The max latency is only reported, a
+# single slow call (a context switch or a GC pass) would fail the comparison on its own:
+COMPARED_METRICS = {"throughput": True, "p50": False, "p95": False, "p99": False, "peak_memory": False}
+
+
+def solve_single(puzzles, options, stats=None):
+    """
+    Entry point solving each board with main.sudoku_solver. Supports boards of any size.
+    :param puzzles: (N, 9, 9) numpy array of puzzles (or (N, n^2, n^2) for other box sizes).
+    :param options: Dictionary of the benchmark options (engine, propagation).
+    :param stats: Optional SolverStats object the search counters are added to.
+    :return: Numpy array of solutions, with the same shape as puzzles.
+    """
+    return np.array([main.sudoku_solver(sudoku, engine=options["engine"], propagation=options["propagation"],
+                                        stats=stats) for sudoku in puzzles]).reshape(puzzles.shape)
+
+
+def solve_batch(puzzles, options, stats=None):
+    """
+    Entry point solving the boards with batch.sudoku_solver_batch. The search counters aren't available.
+    :param puzzles: (N, 9, 9) numpy array of puzzles.
+    :param options: Dictionary of the benchmark options (engine).
+    :param stats: Unused, kept for the common entry point interface.
+    :return: (N, 9, 9) numpy array of solutions.
+    """
+    return batch.sudoku_solver_batch(puzzles, engine=options["engine"])
+
+
+def solve_parallel(puzzles, options, stats=None):
+    """
+    Entry point solving the boards with parallel.sudoku_solver_parallel. The search counters aren't available and the
+    peak memory only covers the main process.
+    :param puzzles: (N, 9, 9) numpy array of puzzles.
+    :param options: Dictionary of the benchmark options (engine, workers).
+    :param stats: Unused, kept for the common entry point interface.
+    :return: (N, 9, 9) numpy array of solutions.
+    """
+    return parallel.sudoku_solver_parallel(puzzles, workers=options["workers"], engine=options["engine"])
+
+
+# Solver entry points, selected through benchmark(entry=...). An entry point is a function
+#     entry(puzzles, options, stats) -> solutions
+# solving an (N, 9, 9) array of puzzles with the benchmark options and adding its search counters to the optional
+# SolverStats object (if it can).
+ENTRY_POINTS = {
+    "single": solve_single,
+    "batch": solve_batch,
+    "parallel": solve_parallel,
+}
+
+
+def load_sets(difficulties=None, csv_path="data/sudoku.csv", csv_sample=1000):
+    """
+    Loads the boards to benchmark: the puzzles and solutions of each difficulty (or large board set) and the first
+    boards of the CSV file, if it exists.
+    :param difficulties: The difficulties and large board sets to load, defaults to all of the difficulties.
+    :param csv_path: Path to the CSV file of puzzles (see dataset.iter_csv), skipped if it doesn't exist.
+    :param csv_sample: The number of boards read from the CSV file.
+    :return: Dictionary of set name (key) and (puzzles, solutions) tuple (value), solutions may be None.
+    """
+    sets = {}
+    for difficulty in difficulties or DIFFICULTIES:
+        sets[difficulty] = (np.load(f"data/{difficulty}_puzzle.npy"), np.load(f"data/{difficulty}_solution.npy"))
+    if csv_path and csv_sample and os.path.exists(csv_path):
+        puzzles, solutions = next(dataset.iter_csv(csv_path, chunk_size=csv_sample), (None, None))
+        if puzzles is not None:
+            sets["csv"] = puzzles, solutions
+    return sets
+
+
+def run_calls(entry, puzzles, options, batch_size, stats=None):
+    """
+    Solves the puzzles with the entry point, batch_size boards per call, timing each call.
+    :param entry: The entry point function, see ENTRY_POINTS.
+    :param puzzles: (N, 9, 9) numpy array of puzzles.
+    :param options: Dictionary of the benchmark options.
+    :param batch_size: The number of boards given to each call.
+    :param stats: Optional SolverStats object the search counters are added to.
+    :return: Tuple of the (N, 9, 9) solutions and the list of call latencies (seconds).
+    """
+    results, latencies = [], []
+    for start in range(0, len(puzzles), batch_size):
+        start_time = time.perf_counter()
+        results.append(entry(puzzles[start:start + batch_size], options, stats))
+        latencies.append(time.perf_counter() - start_time)
+    return np.concatenate(results), latencies
+
+
+def benchmark_set(entry, puzzles, solutions, options, batch_size, repeats=3, warmup=1):
+    """
+    Benchmarks an entry point on a set of boards.
+    The timed passes run after the warm-up calls. The throughput and latency percentiles are computed for each pass
+    and the median over the passes is reported, so one noisy pass can't move them. A final untimed pass measures the
+    peak memory (tracemalloc slows allocations down) and collects the search counters.
+    :param entry: The entry point function, see ENTRY_POINTS.
+    :param puzzles: (N, 9, 9) numpy array of puzzles.
+    :param solutions: (N, 9, 9) numpy array of the expected solutions, or None to skip the correctness check.
+    :param options: Dictionary of the benchmark options.
+    :param batch_size: The number of boards given to each call, latencies are measured per call.
+    :param repeats: The number of timed passes over the boards.
+    :param warmup: The number of untimed calls made before the timed passes.
+    :return: Dictionary of the results (boards, correct, throughput, latency percentiles and max in seconds, peak
+    memory in bytes, nodes).
+    """
+    for start in range(0, min(warmup, -(-len(puzzles) // batch_size)) * batch_size, batch_size):
+        entry(puzzles[start:start + batch_size], options)
+
+    percentiles, throughputs, max_latency, correct = [], [], 0.0, None
+    for _ in range(repeats):
+        results, run_latencies = run_calls(entry, puzzles, options, batch_size)
+        percentiles.append(np.percentile(run_latencies, PERCENTILES))
+        throughputs.append(len(puzzles) / sum(run_latencies))
+        max_latency = max(max_latency, *run_latencies)
+        if solutions is not None:
+            correct = int((results == solutions).all(axis=(1, 2)).sum())
+
+    stats = SolverStats()
+    tracemalloc.start()
+    run_calls(entry, puzzles, options, batch_size, stats)
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    result = {"boards": len(puzzles), "correct": correct, "calls": -(-len(puzzles) // batch_size),
+              "throughput": float(np.median(throughputs))}
+    for percentile, latency in zip(PERCENTILES, np.median(percentiles, axis=0)):  # Median of each pass's percentile
+        result[f"p{percentile}"] = float(latency)
+    result["max"] = max_latency
+    result["peak_memory"] = peak_memory
+    result["nodes"] = stats.nodes if entry is solve_single else None
+    return result
+
+
+def benchmark(entry="single", sets=None, batch_size=None, repeats=3, warmup=1, **options):
+    """
+    Benchmarks a solver entry point on each set of boards.
+    :param entry: The name of the entry point ("single", "batch" or "parallel"), see ENTRY_POINTS.
+    :param sets: Dictionary of set name and (puzzles, solutions) tuple, as returned by load_sets. Defaults to the
+    difficulty sets and the CSV sample.
+    :param batch_size: The number of boards given to each call, defaults to 1 for "single" and the whole set otherwise.
+    :param repeats: The number of timed passes over each set.
+    :param warmup: The number of untimed calls made before the timed passes.
+    :param options: The benchmark options: engine, propagation and workers.
+    :return: Dictionary of the run metadata ("meta") and the results of each set ("results"), ready to dump as JSON.
+    :raises ValueError: If the entry point is unknown, or is not "single" and a set holds boards other than 9x9.
+    """
+    options = {"engine": "dfs", "propagation": None, "workers": None, **options}
+    if entry not in ENTRY_POINTS:
+        raise ValueError(f"Unknown entry point {entry!r}, expected one of {sorted(ENTRY_POINTS)}")
+    if sets is None:
+        sets = load_sets()
+    large_sets = [name for name, (puzzles, _) in sets.items() if np.shape(puzzles)[1:] != (9, 9)]
+    if entry != "single" and large_sets:
+        raise ValueError(f"The {entry} entry point only takes 9x9 boards, can't benchmark {', '.join(large_sets)} "
+                         f"(use the single entry point)")
+
+    results = {}
+    for name, (puzzles, solutions) in sets.items():
+        size = batch_size or (1 if entry == "single" else len(puzzles))
+        results[name] = benchmark_set(ENTRY_POINTS[entry], puzzles, solutions, options, size, repeats, warmup)
+    meta = {"entry": entry, "batch_size": batch_size, "repeats": repeats, "warmup": warmup, **options,
+            "python": platform.python_version(), "numpy": np.__version__, "cpus": os.cpu_count(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+    return {"meta": meta, "results": results}
+
+
+def compare(report, baseline, threshold=0.1):
+    """
+    Compares a benchmark report with a baseline report, finding the metrics that got worse by more than the threshold.
+    :param report: The report of the current run, as returned by benchmark.
+    :param baseline: The baseline report.
+    :param threshold: The allowed relative change (0.1 allows 10% lower throughput or higher latency and memory).
+    :return: List of (set, metric, baseline value, current value, relative change) tuples, one per regression. Sets
+    that fail to solve boards the baseline solved are reported with the "correct" metric.
+    """
+    regressions = []
+    for name, result in report["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            continue
+        if base.get("correct") is not None and result.get("correct") is not None and \
+                result["correct"] < base["correct"]:
+            regressions.append((name, "correct", base["correct"], result["correct"],
+                                (result["correct"] - base["correct"]) / base["correct"]))
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            if not base.get(metric) or result.get(metric) is None:
+                continue
+            change = (result[metric] - base[metric]) / base[metric]
+            if (-change if higher_is_better else change) > threshold:
+                regressions.append((name, metric, base[metric], result[metric], change))
+    return regressions
+
+
+def print_report(report):
+    """
+    Prints the results of a benchmark report as a table.
+    :param report: The report, as returned by benchmark.
+    :return: None
+    """
+    print(f"{'set':>10} {'boards':>7} {'correct':>7} {'boards/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+          f"{'max ms':>9} {'peak KiB':>9} {'nodes':>9}")
+    for name, result in report["results"].items():
+        print(f"{name:>10} {result['boards']:>7} {str(result['correct']):>7} {result['throughput']:>10.1f} "
+              f"{result['p50'] * 1e3:>9.3f} {result['p95'] * 1e3:>9.3f} {result['p99'] * 1e3:>9.3f} "
+              f"{result['max'] * 1e3:>9.3f} {result['peak_memory'] / 1024:>9.1f} {str(result['nodes']):>9}")
+
+
+def parse_args(args=None):
+    """
+    Parses the command line arguments of the benchmark.
+    :param args: List of the arguments, defaults to sys.argv.
+    :return: The parsed arguments (argparse.Namespace).
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the Sudoku solver entry points.")
+    parser.add_argument("--entry", choices=sorted(ENTRY_POINTS), default="single", help="solver entry point")
+    parser.add_argument("--engine", choices=sorted(main.ENGINES), default="dfs", help="search engine")
+    parser.add_argument("--propagation", type=int, default=None,
+                        help="propagation level (single entry point only, defaults to the solver's default)")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (parallel entry point only)")
+    parser.add_argument("--difficulties", nargs="*", choices=DIFFICULTIES + LARGE_SETS, default=DIFFICULTIES,
+                        help="difficulty (or large board) sets to run")
+    parser.add_argument("--csv", default="data/sudoku.csv", help="CSV file to sample, skipped if it doesn't exist")
+    parser.add_argument("--csv-sample", type=int, default=1000, help="number of CSV boards to run (0 to skip)")
+    parser.add_argument("--batch-size", type=int, default=None,
+                        help="boards per call (defaults to 1 for single and the whole set otherwise)")
+    parser.add_argument("--repeats", type=int, default=3, help="timed passes over each set")
+    parser.add_argument("--warmup", type=int, default=1, help="untimed calls before timing each set")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--baseline", help="JSON report to compare against, exits with status 1 on a regression")
+    parser.add_argument("--threshold", type=float, default=0.1, help="allowed relative change in compare mode")
+    arguments = parser.parse_args(args)
+    large_sets = [difficulty for difficulty in arguments.difficulties if difficulty in LARGE_SETS]
+    if arguments.entry != "single" and large_sets:  # Rejected before any set is loaded or solved
+        parser.error(f"the {arguments.entry} entry point only takes 9x9 boards, {' and '.join(large_sets)} can only "
+                     f"be benchmarked with --entry single")
+    return arguments
+
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    benchmark_report = benchmark(arguments.entry, load_sets(arguments.difficulties, arguments.csv,
+                                                            arguments.csv_sample),
+                                 arguments.batch_size, arguments.repeats, arguments.warmup, engine=arguments.engine,
+                                 propagation=arguments.propagation, workers=arguments.workers)
+    print_report(benchmark_report)
+    if arguments.output:
+        with open(arguments.output, "w") as file:
+            json.dump(benchmark_report, file, indent=2)
+
+    if arguments.baseline:
+        with open(arguments.baseline) as file:
+            found = compare(benchmark_report, json.load(file), arguments.threshold)
+        for set_name, metric, base_value, value, relative in found:
+            print(f"REGRESSION {set_name} {metric}: {base_value:.6g} -> {value:.6g} ({relative:+.1%})")
+        if found:
+            sys.exit(1)
+        print("No regressions")
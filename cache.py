@@ -0,0 +1,237 @@
+import os
+import time
+from collections import OrderedDict
+from operator import itemgetter
+
+import main
+import numpy as np
+
+KEY_ROUNDS = 2  # Rounds of refinement of the line keys, see line_keys
+KEY_MODULUS = 2 ** 40  # Keeps the refined line keys within int64
+DIGITS = bytes(range(1, 10))
+
+
+def line_keys(sudoku):
+    """
+    Computes a key for each row and column of a board that doesn't change under digit relabelling or the line
+    permutations that preserve Sudoku solutions (swapping lines within a band and swapping bands).
+    Each given cell is weighted by how often its digit appears on the board, the key of a line starts as the total
+    weight of its cells and is then refined a few times with the keys of the crossing lines through its givens. The
+    rows and columns are refined together, through one matrix of the weights crossing each line.
+    :param sudoku: 9x9 numpy array with values in range (0, 9).
+    :return: Tuple of the row keys and the column keys, as lists of 9 integers.
+    """
+    board = sudoku.astype(np.intp)
+    digit_weights = np.bincount(board.ravel(), minlength=10) * 16 + 1  # How often each digit appears
+    digit_weights[0] = 0  # Empty cells weigh nothing
+    weights = digit_weights[board]
+    crossing = np.zeros((18, 18), dtype=np.intp)  # Weights of the givens crossing each row (0 - 8) and column (9 - 17)
+    crossing[:9, 9:] = weights
+    crossing[9:, :9] = weights.T
+    keys = crossing.sum(axis=1)
+    for _ in range(KEY_ROUNDS):
+        keys = (keys * 7919 + crossing @ (keys % 8191)) % KEY_MODULUS
+    return keys[:9].tolist(), keys[9:].tolist()
+
+
+def line_order(keys):
+    """
+    Orders the lines (rows or columns) of a board by their keys, only moving lines within their band and moving whole
+    bands, i.e. using the line permutations that map a Sudoku board to an equivalent board. Ties keep their order.
+    :param keys: List with the key of each of the 9 lines.
+    :return: List of the 9 lines in their new order.
+    """
+    bands = [sorted(range(band * 3, band * 3 + 3), key=keys.__getitem__) for band in range(3)]
+    bands.sort(key=lambda lines: [keys[line] for line in lines])
+    return bands[0] + bands[1] + bands[2]
+
+
+def canonicalize(sudoku):
+    """
+    Maps a board to a canonical form that is shared by the boards equivalent to it under the transforms that preserve
+    Sudoku solutions: digit relabelling, row and column swaps within a band or stack, band and stack swaps and
+    transposition.
+    Rows and columns are ordered by keys that don't depend on the digits or the order of the other lines (see
+    line_keys), then the digits are relabelled in order of first appearance, for the board and its transpose, and the
+    smaller of the two is kept. Lines with equal keys keep their relative order, so a few symmetric boards don't share
+    a canonical form with every equivalent board; different boards never share one.
+    The board is reordered, transposed and relabelled as bytes, so each step is a single pass in C.
+    :param sudoku: 9x9 numpy array with values in range (0, 9).
+    :return: Tuple of the canonical board (bytes of its 81 cells) and the transform to map boards back (see restore).
+    """
+    cells = sudoku.astype(np.int8).tobytes()
+    row_keys, col_keys = line_keys(sudoku)
+    rows, cols = line_order(row_keys), line_order(col_keys)
+    board = bytes(itemgetter(*[row * 9 + col for row in rows for col in cols])(cells))
+    best = None  # The board and its transpose, whose rows are the columns of the board, are both relabelled
+    for orientation, lines, line_rows, line_cols in ((0, board, rows, cols),
+                                                     (1, b"".join(board[col::9] for col in range(9)), cols, rows)):
+        # Relabel the digits in order of first appearance. Digits that don't appear are only found in the digits
+        # appended to the board, so they keep their relative order at the end:
+        labels = bytes.maketrans(bytes(sorted(DIGITS, key=(lines + DIGITS).find)), DIGITS)  # New label of each byte
+        lines = lines.translate(labels)
+        if best is None or lines < best[0]:
+            best = lines, (orientation, line_rows, line_cols, list(labels[:10]))
+    return best
+
+
+def restore(board, transform):
+    """
+    Maps a board in canonical form back through the inverse of the transform returned by canonicalize.
+    :param board: 9x9 numpy array in canonical form (e.g. the solution of a canonical board), or filled with -1.
+    :param transform: The transform returned by canonicalize.
+    :return: 9x9 numpy array of integers.
+    """
+    orientation, rows, cols, labels = transform
+    if (board == -1).all():
+        return np.full(shape=(9, 9), fill_value=-1, dtype=int)
+    inverse_labels = np.zeros(10, dtype=int)
+    inverse_labels[labels] = np.arange(10)  # Maps each new label back to its digit
+    restored = np.empty((9, 9), dtype=int)
+    restored[np.ix_(rows, cols)] = inverse_labels[board]
+    return restored.T if orientation else restored
+
+
+class SolutionCache:
+    """
+    LRU cache of solutions in front of main.sudoku_solver. Boards are looked up as given (exact duplicates) and then by
+    their canonical form (see canonicalize), so a board is also found when an equivalent board (relabelled, with
+    swapped lines or transposed) was solved before. Every entry maps the bytes of a board to the solution of exactly
+    that board, so both kinds of key share one LRU order and size limit.
+    Boards that the propagation alone solves are not looked up by canonical form, as canonicalizing costs about as much
+    as solving them: they are solved directly and cached as given, so only their exact duplicates are found.
+    For boards with more than one solution the cached solution may differ from the one sudoku_solver would find, but
+    it is always a solution of the board.
+    """
+    def __init__(self, max_size=100000, path=None, **solver_args):
+        """
+        Creates an empty SolutionCache Object, loading the cache saved at path if it exists.
+        :param max_size: The maximum number of entries kept, the least recently used are evicted first.
+        :param path: Optional file to load the cache from (see save).
+        :param solver_args: Arguments passed on to main.sudoku_solver (e.g. engine, propagation).
+        """
+        self.max_size = max_size
+        self.solver_args = solver_args
+        self.entries = OrderedDict()  # Board bytes (key), 9x9 int8 solution (value), least recently used first
+        self.hits = 0  # Number of boards found in the cache
+        self.misses = 0  # Number of boards solved and added to the cache
+        self.lookup_time = 0.0  # Total seconds spent canonicalizing and looking boards up
+        if path and os.path.exists(path):
+            self.load(path)
+
+    @property
+    def hit_rate(self):
+        """
+        The fraction of boards that were found in the cache.
+        :return: Hit rate in range (0, 1), 0 if no boards were looked up.
+        """
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    @property
+    def mean_lookup_time(self):
+        """
+        The mean number of seconds spent canonicalizing and looking a board up (excluding solves on misses).
+        :return: Mean seconds per lookup, 0 if no boards were looked up.
+        """
+        lookups = self.hits + self.misses
+        return self.lookup_time / lookups if lookups else 0.0
+
+    def get(self, key):
+        """
+        Looks an entry up, marking it as the most recently used.
+        :param key: The bytes of the board.
+        :return: The 9x9 int8 solution of the board, or None if it is not cached.
+        """
+        solution = self.entries.get(key)
+        if solution is not None:
+            self.entries.move_to_end(key)
+        return solution
+
+    def put(self, key, solution):
+        """
+        Adds an entry as the most recently used, evicting the least recently used entry if the cache is full.
+        :param key: The bytes of the board.
+        :param solution: The 9x9 solution of the board (filled with -1 if it has no solution).
+        :return: None
+        """
+        self.entries[key] = solution.astype(np.int8)
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def sudoku_solver(self, sudoku):
+        """
+        Solves a Sudoku puzzle, reusing the cached solution of the same or an equivalent board if there is one.
+
+        Input
+            sudoku : 9x9 numpy array
+                Empty cells are designated by 0.
+
+        Output
+            9x9 numpy array of integers
+                It contains the solution, if there is one. If there is no solution, all array entries are -1.
+        """
+        sudoku = np.asarray(sudoku)
+        if ((sudoku < 0) | (sudoku > 9)).any():
+            return main.sudoku_solver(sudoku, **self.solver_args)  # Invalid values can't be relabelled, never cached
+
+        start_time = time.perf_counter()
+        key = sudoku.astype(np.int8).tobytes()
+        solution = self.get(key)  # Exact duplicates skip canonicalization
+        self.lookup_time += time.perf_counter() - start_time
+        if solution is not None:
+            self.hits += 1
+            return solution.astype(int)
+
+        # Boards that the propagation alone solves (or shows have no solution) take about as long as canonicalizing
+        # them, so they are solved directly and only cached as given:
+        state, _ = main.init_state(sudoku, self.solver_args.get("propagation"), self.solver_args.get("stats"))
+        if state is None or state.is_goal():
+            self.misses += 1
+            solution = state.final_values if state is not None else np.full(shape=(9, 9), fill_value=-1, dtype=int)
+            self.put(key, solution)
+            return solution
+
+        start_time = time.perf_counter()
+        canonical_key, transform = canonicalize(sudoku)
+        solution = self.get(canonical_key)
+        if solution is not None:
+            solution = restore(solution, transform)
+            self.put(key, solution)
+        self.lookup_time += time.perf_counter() - start_time
+        if solution is not None:
+            self.hits += 1
+            return solution.astype(int)
+
+        self.misses += 1
+        canonical = np.frombuffer(canonical_key, dtype=np.int8).reshape(9, 9)
+        canonical_solution = main.sudoku_solver(canonical, **self.solver_args)  # Cache the canonical board's solution
+        self.put(canonical_key, canonical_solution)
+        solution = restore(canonical_solution, transform)
+        if key != canonical_key:
+            self.put(key, solution)
+        return solution
+
+    __call__ = sudoku_solver
+
+    def save(self, path):
+        """
+        Saves the cached boards and solutions to a .npz file, in least recently used order.
+        :param path: Path of the file to write.
+        :return: None
+        """
+        boards = np.frombuffer(b"".join(self.entries), dtype=np.int8).reshape(-1, 9, 9)
+        solutions = np.array(list(self.entries.values()), dtype=np.int8).reshape(-1, 9, 9)
+        with open(path, "wb") as file:  # Keeps numpy from adding an .npz extension to the path
+            np.savez(file, boards=boards, solutions=solutions)
+
+    def load(self, path):
+        """
+        Loads boards and solutions saved by save into the cache, as the most recently used entries.
+        :param path: Path of the file to read.
+        :return: None
+        """
+        with np.load(path) as data:
+            for board, solution in zip(data["boards"], data["solutions"]):
+                self.put(board.tobytes(), solution)
@@ -0,0 +1,231 @@
+import struct
+from itertools import chain, islice
+
+import numpy as np
+
+# Compact binary dataset format (.sdk), readable with np.memmap:
+#   Header (16 bytes, little-endian): magic b"SDKB", version (uint8), flags (uint8), box size (uint8), padding (1 byte),
+#                                     number of boards (uint64).
+#   Records: one per board, the puzzle cells followed by the solution cells (if FLAG_SOLUTIONS is set). Cells are in
+#            row-major order, one uint8 per cell, or two cells per byte (high nibble first) if FLAG_PACKED is set.
+MAGIC = b"SDKB"
+VERSION = 1
+HEADER = struct.Struct("<4sBBBxQ")
+FLAG_PACKED = 1  # Cells are packed as 4-bit values, two per byte
+FLAG_SOLUTIONS = 2  # Each record holds a solution after the puzzle
+CELLS = 81
+PACKED_CELLS = (CELLS + 1) // 2  # Bytes used by a packed board
+
+# Maps each character of a CSV board to its cell value, "0" and "." are empty cells, anything else is invalid (255).
+CHAR_VALUES = np.full(256, 255, dtype=np.uint8)
+CHAR_VALUES[np.frombuffer(b"0123456789", dtype=np.uint8)] = np.arange(10, dtype=np.uint8)
+CHAR_VALUES[ord(".")] = 0
+
+
+def parse_boards(data):
+    """
+    Converts the characters of a block of boards into their cell values, in a single vectorized pass.
+    :param data: (N, 81) uint8 numpy array of characters, one board per row with the cells in row-major order.
+    :return: (N, 9, 9) uint8 numpy array of boards.
+    """
+    boards = CHAR_VALUES[data]
+    if (boards == 255).any():
+        raise ValueError("Boards may only contain the digits 0 - 9 and '.'")
+    return boards.reshape(-1, 9, 9)
+
+
+def split_lines(lines):
+    """
+    Splits CSV lines into the characters of their puzzle and (optional) solution columns.
+    Lines of equal length (the usual case) are split as a single (N, line length) character array, other blocks fall
+    back to splitting each line on the comma.
+    :param lines: List of bytes, one line per board.
+    :return: Tuple of (puzzles, solutions) (N, 81) uint8 character arrays, solutions is None if there is no solution
+    column.
+    """
+    data = np.frombuffer(b"".join(lines), dtype=np.uint8)
+    width = len(lines[0])
+    if len(data) == len(lines) * width and width >= CELLS:
+        data = data.reshape(len(lines), width)
+        if width < 2 * CELLS + 1 or (data[:, CELLS] == ord(",")).all():
+            solutions = data[:, CELLS + 1:2 * CELLS + 1] if width >= 2 * CELLS + 1 else None
+            return data[:, :CELLS], solutions
+
+    columns = [line.strip().split(b",") for line in lines]
+    if any(len(fields[0]) != CELLS or len(fields) != len(columns[0]) for fields in columns):
+        raise ValueError(f"Expected boards of {CELLS} cells")
+    puzzles = np.frombuffer(b"".join(fields[0] for fields in columns), dtype=np.uint8).reshape(-1, CELLS)
+    if len(columns[0]) < 2:
+        return puzzles, None
+    if any(len(fields[1]) != CELLS for fields in columns):
+        raise ValueError(f"Expected boards of {CELLS} cells")
+    return puzzles, np.frombuffer(b"".join(fields[1] for fields in columns), dtype=np.uint8).reshape(-1, CELLS)
+
+
+def iter_csv(path, chunk_size=100000, header=True):
+    """
+    Streams a CSV file of puzzles (and optionally solutions), such as the Kaggle 1M puzzle set (data/sudoku.csv).
+    Each line holds a puzzle and an optional solution, as 81 character strings separated by a comma. Only chunk_size
+    lines are held in memory at a time.
+    :param path: Path to the CSV file.
+    :param chunk_size: The number of boards in each block.
+    :param header: Whether the first line is a header that should be skipped.
+    :return: Generator of (puzzles, solutions) tuples, each a (N, 9, 9) uint8 numpy array. solutions is None if the
+    file has no solution column.
+    """
+    with open(path, "rb") as file:
+        if header:
+            file.readline()
+        while True:
+            lines = list(islice(file, chunk_size))
+            if not lines:
+                return
+            if not lines[-1].strip():
+                lines = [line for line in lines if line.strip()]  # Skip blank lines at the end of the file
+                if not lines:
+                    return
+            puzzles, solutions = split_lines(lines)
+            yield parse_boards(puzzles), solutions if solutions is None else parse_boards(solutions)
+
+
+def pack(boards):
+    """
+    Packs boards into 4-bit cells, two cells per byte (high nibble first).
+    :param boards: (N, 9, 9) numpy array of boards with values in range (0, 15).
+    :return: (N, 41) uint8 numpy array of packed boards.
+    """
+    cells = np.zeros((len(boards), PACKED_CELLS * 2), dtype=np.uint8)
+    cells[:, :CELLS] = boards.reshape(-1, CELLS)
+    return (cells[:, 0::2] << 4) | cells[:, 1::2]
+
+
+def unpack(packed):
+    """
+    Unpacks boards packed by pack.
+    :param packed: (N, 41) uint8 numpy array of packed boards.
+    :return: (N, 9, 9) uint8 numpy array of boards.
+    """
+    cells = np.empty((len(packed), PACKED_CELLS * 2), dtype=np.uint8)
+    cells[:, 0::2] = packed >> 4
+    cells[:, 1::2] = packed & 0xF
+    return cells[:, :CELLS].reshape(-1, 9, 9)
+
+
+def record_dtype(flags):
+    """
+    Builds the numpy dtype of a single record of the binary format.
+    :param flags: The format flags (FLAG_PACKED, FLAG_SOLUTIONS).
+    :return: Structured numpy dtype with a "puzzle" field and, if present, a "solution" field.
+    """
+    shape = (PACKED_CELLS,) if flags & FLAG_PACKED else (9, 9)
+    fields = [("puzzle", np.uint8, shape)]
+    if flags & FLAG_SOLUTIONS:
+        fields.append(("solution", np.uint8, shape))
+    return np.dtype(fields)
+
+
+def write_dataset(path, blocks, packed=False, solutions=True):
+    """
+    Writes blocks of boards to a binary dataset file, streaming them so only one block is held in memory at a time.
+    :param path: Path of the file to write.
+    :param blocks: Iterable of (puzzles, solutions) tuples of (N, 9, 9) arrays, as returned by iter_csv.
+    :param packed: Whether to pack the cells into 4 bits.
+    :param solutions: Whether to store the solutions. Every block must then have solutions.
+    :return: The number of boards written.
+    """
+    flags = (FLAG_PACKED if packed else 0) | (FLAG_SOLUTIONS if solutions else 0)
+    dtype = record_dtype(flags)
+    count = 0
+    with open(path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, VERSION, flags, 3, 0))  # The count is filled in once every block is written
+        for puzzles, block_solutions in blocks:
+            if solutions and block_solutions is None:
+                raise ValueError("Every block must have solutions when solutions=True")
+            records = np.empty(len(puzzles), dtype=dtype)
+            records["puzzle"] = pack(puzzles) if packed else puzzles
+            if solutions:
+                records["solution"] = pack(block_solutions) if packed else block_solutions
+            file.write(records.tobytes())
+            count += len(records)
+        file.seek(0)
+        file.write(HEADER.pack(MAGIC, VERSION, flags, 3, count))
+    return count
+
+
+def convert_csv(csv_path, out_path, packed=False, chunk_size=100000, header=True):
+    """
+    Converts a CSV file of puzzles (see iter_csv) into the binary dataset format.
+    :param csv_path: Path to the CSV file.
+    :param out_path: Path of the binary file to write.
+    :param packed: Whether to pack the cells into 4 bits.
+    :param chunk_size: The number of boards converted at a time.
+    :param header: Whether the first line of the CSV is a header that should be skipped.
+    :return: The number of boards written.
+    """
+    blocks = iter_csv(csv_path, chunk_size, header)
+    first = next(blocks, None)
+    if first is None:
+        return write_dataset(out_path, [], packed, solutions=False)
+    return write_dataset(out_path, chain([first], blocks), packed, solutions=first[1] is not None)
+
+
+def convert_npy(puzzles_path, out_path, solutions_path=None, packed=False, chunk_size=100000):
+    """
+    Converts .npy files of puzzles (and optionally solutions), such as data/hard_puzzle.npy, into the binary dataset
+    format. Boards with no solution (filled with -1) are stored with an empty (all zero) solution.
+    :param puzzles_path: Path to the (N, 9, 9) puzzles .npy file.
+    :param out_path: Path of the binary file to write.
+    :param solutions_path: Optional path to the (N, 9, 9) solutions .npy file.
+    :param packed: Whether to pack the cells into 4 bits.
+    :param chunk_size: The number of boards converted at a time.
+    :return: The number of boards written.
+    """
+    puzzles = np.load(puzzles_path, mmap_mode="r")
+    solutions = np.load(solutions_path, mmap_mode="r") if solutions_path else None
+
+    def blocks():
+        for start in range(0, len(puzzles), chunk_size):
+            block_solutions = None
+            if solutions is not None:
+                block_solutions = np.clip(solutions[start:start + chunk_size], 0, 9).astype(np.uint8)
+            yield puzzles[start:start + chunk_size].astype(np.uint8), block_solutions
+
+    return write_dataset(out_path, blocks(), packed, solutions=solutions is not None)
+
+
+def open_dataset(path):
+    """
+    Memory-maps a binary dataset file, without reading the boards into memory.
+    Unpacked files give (N, 9, 9) uint8 views that can be passed straight to the solvers, packed files give (N, 41)
+    views that can be unpacked a block at a time with unpack (or read through iter_dataset).
+    :param path: Path to the binary file.
+    :return: Tuple of (puzzles, solutions, packed), solutions is None if the file has no solutions.
+    """
+    with open(path, "rb") as file:
+        magic, version, flags, box_size, count = HEADER.unpack(file.read(HEADER.size))
+    if magic != MAGIC or version != VERSION or box_size != 3:
+        raise ValueError(f"{path} is not a version {VERSION} Sudoku dataset")
+    dtype = record_dtype(flags)
+    if count == 0:  # np.memmap can't map an empty range
+        records = np.empty(0, dtype=dtype)
+    else:
+        records = np.memmap(path, dtype=dtype, mode="r", offset=HEADER.size, shape=(count,))
+    solutions = records["solution"] if flags & FLAG_SOLUTIONS else None
+    return records["puzzle"], solutions, bool(flags & FLAG_PACKED)
+
+
+def iter_dataset(path, chunk_size=100000):
+    """
+    Streams the boards of a binary dataset file in blocks, unpacking them if needed.
+    :param path: Path to the binary file.
+    :param chunk_size: The number of boards in each block.
+    :return: Generator of (puzzles, solutions) tuples, each a (N, 9, 9) uint8 numpy array. solutions is None if the
+    file has no solutions.
+    """
+    puzzles, solutions, packed = open_dataset(path)
+    for start in range(0, len(puzzles), chunk_size):
+        blocks = [puzzles[start:start + chunk_size]]
+        if solutions is not None:
+            blocks.append(solutions[start:start + chunk_size])
+        blocks = [unpack(block) if packed else np.asarray(block) for block in blocks]
+        yield blocks[0], blocks[1] if solutions is not None else None
@@ -0,0 +1,169 @@
+import time
+
+from SudokuState import GEOMETRY, PROPAGATION_NAKED_SINGLES
+
+
+def build_cover_tables(geometry):
+    """
+    Builds the exact cover matrix of a board size. Each of the n^6 options (row = cell * n^2 + value - 1) covers exactly
+    four of the 4 n^4 constraints (columns): the cell is filled, and the value appears once in the cell's row, column
+    and block. For the standard board that is 729 options and 324 constraints.
+    :param geometry: The BoardGeometry of the board size.
+    :return: Tuple of the four columns of each option and the n^2 options covering each column.
+    """
+    size, cells = geometry.size, geometry.cells
+    option_columns = tuple((cell, cells + geometry.cell_row[cell] * size + value,
+                            2 * cells + geometry.cell_col[cell] * size + value,
+                            3 * cells + geometry.cell_box[cell] * size + value)
+                           for cell in range(cells) for value in range(size))
+    column_options = [[] for _ in range(4 * cells)]
+    for option, columns in enumerate(option_columns):
+        for column in columns:
+            column_options[column].append(option)
+    return option_columns, tuple(map(tuple, column_options))
+
+
+COVER_TABLES = {}  # Holds the (option columns, column options) tables (value) of each box size (key) used so far
+
+
+def get_cover_tables(geometry):
+    """
+    Finds the exact cover tables of a board size, building them the first time the size is used.
+    :param geometry: The BoardGeometry of the board size.
+    :return: Tuple of the four columns of each option and the options covering each column, see build_cover_tables.
+    """
+    tables = COVER_TABLES.get(geometry.box_size)
+    if tables is None:
+        tables = COVER_TABLES[geometry.box_size] = build_cover_tables(geometry)
+    return tables
+
+
+# Tables of the standard 9x9 board:
+OPTION_COLUMNS, COLUMN_OPTIONS = get_cover_tables(GEOMETRY)
+COLUMN_COUNT = len(COLUMN_OPTIONS)
+
+
+class ExactCover:
+    """
+    Compact array-based version of Knuth's Algorithm X over the Sudoku constraints (324 for the standard board).
+    Instead of the linked lists of Dancing Links, each option keeps a count of the covered columns that block it and
+    each column keeps the number of unblocked options that can still cover it. Covering and uncovering only change
+    these counters, in mirrored order, so the search can backtrack without copying.
+    """
+    def __init__(self, sudoku_state):
+        """
+        Creates the exact cover matrix of the given board. The filled cells cover their constraints and only the
+        candidates of the empty cells are left as options.
+        :param sudoku_state: The sudoku state to convert, with its constraints initialised (SudokuState Object).
+        """
+        self.option_columns, self.column_options = get_cover_tables(sudoku_state.geometry)
+        size = sudoku_state.geometry.size
+        self.covered = [False] * len(self.column_options)  # Whether each constraint has been covered
+        self.blocked = [1] * len(self.option_columns)  # Covered columns blocking each option (1 if ruled out up front)
+        self.size = [0] * len(self.column_options)  # Number of unblocked options of each column
+        for cell, value in enumerate(sudoku_state.values):
+            if value:
+                for column in self.option_columns[cell * size + value - 1]:
+                    self.covered[column] = True
+            else:
+                for value in sudoku_state.get_possible_values(cell):
+                    option = cell * size + value - 1
+                    self.blocked[option] = 0
+                    for column in self.option_columns[option]:
+                        self.size[column] += 1
+        self.remaining = self.covered.count(False)  # Number of constraints left to cover
+
+    def choose_options(self):
+        """
+        Picks the uncovered column with the fewest options (the exact cover version of the MRV heuristic).
+        :return: List of the unblocked options of the column, empty if the column can no longer be covered.
+        """
+        covered, size = self.covered, self.size
+        column = min((column for column in range(len(covered)) if not covered[column]), key=size.__getitem__)
+        return [option for option in self.column_options[column] if not self.blocked[option]]
+
+    def select(self, option):
+        """
+        Adds the option to the partial solution, covering its columns and blocking every option that shares them.
+        :param option: The option (cell * n^2 + value - 1) to select.
+        :return: None
+        """
+        blocked, size, option_columns = self.blocked, self.size, self.option_columns
+        for column in option_columns[option]:
+            self.covered[column] = True
+            for other in self.column_options[column]:
+                if not blocked[other]:
+                    for other_column in option_columns[other]:
+                        size[other_column] -= 1
+                blocked[other] += 1
+        self.remaining -= 4
+
+    def deselect(self, option):
+        """
+        Removes the option from the partial solution, undoing select in reverse order.
+        :param option: The option (cell * n^2 + value - 1) to deselect.
+        :return: None
+        """
+        blocked, size, option_columns = self.blocked, self.size, self.option_columns
+        for column in reversed(option_columns[option]):
+            for other in reversed(self.column_options[column]):
+                blocked[other] -= 1
+                if not blocked[other]:
+                    for other_column in option_columns[other]:
+                        size[other_column] += 1
+            self.covered[column] = False
+        self.remaining += 4
+
+
+def exact_cover_search(sudoku_state, level=PROPAGATION_NAKED_SINGLES, stats=None, budget=None):
+    """
+    Solves the given Sudoku board as an exact cover problem, using an iterative Algorithm X (see ExactCover).
+    At each step the uncovered constraint with the fewest options is chosen and each of its options is tried in turn,
+    so forced moves (naked and hidden singles) are found by the choice of column rather than by propagation.
+    :param sudoku_state: Sudoku board configuration to be evaluated (SudokuState object). Filled in if solved.
+    :param level: Unused, the propagation level of the other engines (kept for the common engine interface).
+    :param stats: Optional SolverStats object the search counters and timings are added to. Choosing a column counts
+    as heuristic time, selecting an option as propagation time and deselecting it as copy (undo) time.
+    :param budget: Optional SearchBudget object the nodes are reported to, limiting the search.
+    :return: The SudokuState representing the solved board, or None (indicating it is not solvable).
+    """
+    matrix = ExactCover(sudoku_state)
+    stack = [[matrix.choose_options(), 0]]  # Frames of [options, next index]
+    while stack:
+        frame = stack[-1]
+        options, index = frame
+        if index:
+            if stats is None:
+                matrix.deselect(options[index - 1])  # Undo the previous option tried for this column
+            else:
+                start_time = time.perf_counter()
+                matrix.deselect(options[index - 1])
+                stats.time_copy += time.perf_counter() - start_time
+                stats.backtrack(len(stack))
+        if index == len(options):
+            stack.pop()  # Every option failed, backtrack to the previous column
+            continue
+        frame[1] = index + 1
+
+        if budget is not None:
+            budget.node()
+        if stats is None:
+            matrix.select(options[index])
+        else:
+            stats.node(len(stack))
+            start_time = time.perf_counter()
+            matrix.select(options[index])
+            stats.time_propagation += time.perf_counter() - start_time
+        if not matrix.remaining:  # Every constraint is covered, fill in the selected options
+            for options, index in stack:
+                cell, value = divmod(options[index - 1], sudoku_state.geometry.size)
+                sudoku_state.assign(cell, value + 1)
+            return sudoku_state
+        if stats is None:
+            stack.append([matrix.choose_options(), 0])
+        else:
+            start_time = time.perf_counter()
+            stack.append([matrix.choose_options(), 0])
+            stats.time_heuristic += time.perf_counter() - start_time
+
+    return None
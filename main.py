@@ -1,54 +1,45 @@
+import time
+
 import SudokuState
 import numpy as np
+from exact_cover import exact_cover_search
+from SolverStats import SearchBudget, SolverGaveUp  # SolverGaveUp is part of the sudoku_solver interface
+from SudokuState import PROPAGATION_HIDDEN_SINGLES, PROPAGATION_NAKED_SINGLES, PROPAGATION_STAGES
 
 
 def get_min_value_positions(sudoku_state):
     """
     Finds the minimum remaining values for any state in the board, and then finds all positions that have the same
     number of values, i.e. all the states that have the minimum number of remaining values.
+    Reads the first non-empty bucket of the state's index of empty positions by number of possible values. The bucket
+    is returned as is, unordered and without a copy, so it must not be changed while in use.
     :param sudoku_state: The sudoku state to apply the heuristic to (SudokuState Object).
-    :return: A list of the positions with the minimum remaining values.
+    :return: The set of the flat positions (row * n^2 + col) with the minimum remaining values.
     """
-    position_choices = {}  # Holds list of positions (value) for each number 0 - 9 (key)
-    for key in range(10):  # Populate dictionary with empty lists
-        position_choices[key] = []
-
-    for (row, col), final_value in np.ndenumerate(sudoku_state.final_values):
-        if final_value == 0:  # If it is an empty position
-            position_choices[len(sudoku_state.possible_values[row][col])].append((row, col))  # Add it to the dictionary
-
-    # Find the position(s) with the minimum possible moves
-    for i in range(10):
-        if position_choices[i]:
-            return position_choices[i]  # Return the list with the least remaining values
+    for bucket in sudoku_state.buckets:
+        if bucket:
+            return bucket  # Return the positions with the least remaining values
 
 
-def get_degree(sudoku_state, row, col):
+def get_degree(sudoku_state, cell):
     """
     Finds the number of empty positions affecting the element, i.e. the empty positions on the same row, column
     and block. Used for the degree heuristic.
+    The empty positions of each unit are counted from its used mask, then the empty positions on both the block and the
+    row or column (counted twice) are subtracted.
     :param sudoku_state: The sudoku state to evaluate (SudokuState Object).
-    :param row: The row of the position to be evaluated.
-    :param col: The column of the position to be evaluated.
+    :param cell: The flat position (row * n^2 + col) to be evaluated.
     :return: The given position's degree (the number of empty positions on the same row, column and block).
     """
-    degree_counter = 0  # Holds the number of empty positions on the same row, column and block
-    for i in range(9):
-        if sudoku_state.final_values[row][i] == 0:  # Search the column
-            degree_counter += 1
-        if sudoku_state.final_values[i][col] == 0:  # Search the row
-            degree_counter += 1
-
-    # Find start of 3x3 block:
-    block_row = row - (row % 3)
-    block_col = col - (col % 3)
-
-    # Check each element in the 3x3 block:
-    for temp_row in range(3):
-        for temp_col in range(3):
-            if sudoku_state.final_values[temp_row + block_row][temp_col + block_col]:  # Empty position in block
-                degree_counter += 1
-
+    values, geometry = sudoku_state.values, sudoku_state.geometry
+    bit_count = geometry.bit_count
+    # Empty positions on the row, column and block, excluding the position itself:
+    degree_counter = 3 * (geometry.size - 1) - bit_count[sudoku_state.row_used[geometry.cell_row[cell]]] - \
+        bit_count[sudoku_state.col_used[geometry.cell_col[cell]]] - \
+        bit_count[sudoku_state.box_used[geometry.cell_box[cell]]]
+    for peer in geometry.box_line_peers[cell]:
+        if values[peer] == 0:  # Empty position counted in both the block and the row or column
+            degree_counter -= 1
     return degree_counter  # Return the number of positions affected by the current position
 
 
@@ -60,71 +51,291 @@ def pick_next_cell(sudoku_state):
     Minimum-remaining-values heuristic --> finds the position(s) with the least possible remaining moves.
     Degree heuristic --> finds the position that affects (and is affected by) the maximum number of empty positions.
     :param sudoku_state: The sudoku state to apply the heuristics to (SudokuState Object).
-    :return: The position (row, col) of the most constrained value.
+    :return: The flat position (row * n^2 + col) of the most constrained value.
     """
     # Use the minimum-remaining values heuristic:
-    min_value_positions = get_min_value_positions(sudoku_state)  # Get the positions (row, col) with the minimum moves
+    min_value_positions = get_min_value_positions(sudoku_state)  # Get the positions with the minimum moves
 
     if len(min_value_positions) == 1:  # If the MRV returns one position, don't apply degree heuristic
-        return min_value_positions[0][0], min_value_positions[0][1]  # Return the coordinates of the position
+        return next(iter(min_value_positions))  # Return the position
 
-    # Use the degree heuristic:
-    max_row, max_col, max_degree = -1, -1, 0  # Assume the highest degree is 0 at first
-    for position in min_value_positions:  # Loop through all of the minimum-remaining-values positions
-        curr_degree = get_degree(sudoku_state, position[0], position[1])  # Get the degree for the position
-        if curr_degree > max_degree:
+    # Use the degree heuristic, breaking ties by the first position in row-major order (the bucket is unordered):
+    max_cell, max_degree = -1, -1
+    for cell in min_value_positions:  # Loop through all of the minimum-remaining-values positions
+        curr_degree = get_degree(sudoku_state, cell)  # Get the degree for the position
+        if curr_degree > max_degree or (curr_degree == max_degree and cell < max_cell):
             max_degree = curr_degree  # If the current degree is higher than the max, update the max
-            max_row, max_col = position  # Update the coordinates of the max
-    return max_row, max_col  # Return the coordinates of the position with the highest degree
+            max_cell = cell  # Update the position of the max
+    return max_cell  # Return the position with the highest degree
 
 
-def depth_first_search(sudoku_state):
+def depth_first_search(sudoku_state, level=PROPAGATION_NAKED_SINGLES, stats=None, budget=None, depth=1):
     """
     Uses the depth-first search (DFS) algorithm to find a solution (if it exists) to the given Sudoku board.
     Makes use of the minimum-remaining-value (MRV) and degree heuristics to find a solution to the given board, if
     a solution exists. After selecting a position to fill, it creates a new SudokuState object for each possible value
     of the current position. It then recursively calls itself until it finds the solution, or an invalid state,
-    backtracking if needed. Identifies dead-ends without going "deep", by checking if they are solvable.
+    backtracking if needed. Identifies dead-ends without going "deep", as the propagation after each assignment
+    rejects values that leave a position or a value of a unit without a place.
     :param sudoku_state: Sudoku board configuration to be evaluated (SudokuState object).
+    :param level: The propagation level applied after each assignment, see SudokuState.propagate.
+    :param stats: Optional SolverStats object the search counters and timings are added to.
+    :param budget: Optional SearchBudget object the nodes are reported to, limiting the search.
+    :param depth: The search depth of the values tried by this call (1 for the first position chosen).
     :return: The SudokuState representing the solved board, or None (indicating it is not solvable).
     """
-    row, col = pick_next_cell(sudoku_state)  # Pick position for next move
-    values = sudoku_state.possible_values[row][col]
-    for value in values:  # For each possible value
-        new_state = sudoku_state.gen_next_state(row, col, value)  # Generate the resulting board
-        if new_state.is_goal():
-            return new_state  # If it is a goal state return it
-        if new_state.is_solvable():
-            deep_state = depth_first_search(new_state)
+    if stats is None:
+        cell = pick_next_cell(sudoku_state)  # Pick position for next move
+    else:
+        start_time = time.perf_counter()
+        cell = pick_next_cell(sudoku_state)
+        stats.time_heuristic += time.perf_counter() - start_time
+    for value in sudoku_state.get_possible_values(cell):  # For each possible value
+        if stats is not None:
+            stats.node(depth)
+        if budget is not None:
+            budget.node()
+        new_state = sudoku_state.gen_next_state(cell, value, level)  # Generate the resulting board
+        if new_state is not None:  # Skip dead-ends found by the propagation
+            if new_state.is_goal():
+                return new_state  # If it is a goal state return it
+            deep_state = depth_first_search(new_state, level, stats, budget, depth + 1)
             if deep_state and deep_state.is_goal():
                 return deep_state  # If it is a goal state return it
+        if stats is not None:
+            stats.backtrack(depth)
 
     return None
 
 
-def sudoku_solver(sudoku):
+def iter_trail_solutions(sudoku_state, level=PROPAGATION_NAKED_SINGLES, stats=None, budget=None):
+    """
+    Uses an iterative depth-first search to find the solutions (if any) of the given Sudoku board, changing a single
+    SudokuState in place instead of copying it for every possible value.
+    Every assignment and candidate removal is logged on the state's trail (an undo log of old candidate masks). Each
+    level of the search marks the length of the trail before trying its first value, and rolls the state back to the
+    mark (see SudokuState.undo) before trying each further value. A level whose values all fail is rolled back by the
+    level above, when it tries its own next value. An explicit stack replaces recursion. Uses the same MRV and degree
+    heuristics and propagation as depth_first_search.
+    :param sudoku_state: Sudoku board configuration to be evaluated (SudokuState object). It is changed in place.
+    :param level: The propagation level applied after each assignment, see SudokuState.propagate.
+    :param stats: Optional SolverStats object the search counters and timings are added to.
+    :param budget: Optional SearchBudget object the nodes are reported to, limiting the search.
+    :return: Generator of the SudokuState at each solution, in search order. The same state is yielded every time and
+    is changed again when the search resumes, so its values must be copied before asking for the next solution.
+    """
+    if stats is None:
+        cell = pick_next_cell(sudoku_state)  # Pick position for first move
+    else:
+        start_time = time.perf_counter()
+        cell = pick_next_cell(sudoku_state)
+        stats.time_heuristic += time.perf_counter() - start_time
+    trail = sudoku_state.trail = []
+    stack = [[cell, sudoku_state.get_possible_values(cell), 0, 0]]  # Frames of [position, values, next index, mark]
+    try:
+        while stack:
+            frame = stack[-1]
+            cell, values, index, mark = frame
+            if stats is not None and index:
+                stats.backtrack(len(stack))  # The previous value tried in this position failed
+            if index == len(values):
+                stack.pop()  # Every value failed, backtrack to the previous position (rolled back by its next value)
+                continue
+            frame[2] = index + 1
+
+            if index:
+                if stats is None:
+                    sudoku_state.undo(mark)  # Roll back the previous value tried
+                else:
+                    start_time = time.perf_counter()
+                    sudoku_state.undo(mark)
+                    stats.time_copy += time.perf_counter() - start_time
+
+            if budget is not None:
+                budget.node()
+            if stats is None:
+                consistent = sudoku_state.assign(cell, values[index]) and sudoku_state.propagate(level)
+            else:
+                stats.node(len(stack))
+                start_time = time.perf_counter()
+                consistent = sudoku_state.assign(cell, values[index]) and sudoku_state.propagate(level)
+                stats.time_propagation += time.perf_counter() - start_time
+            if consistent:
+                if sudoku_state.is_goal():
+                    yield sudoku_state  # If it is a goal state yield it, then carry on with the next value
+                elif sudoku_state.is_solvable():
+                    if stats is None:
+                        cell = pick_next_cell(sudoku_state)  # Go deeper, picking the next position
+                    else:
+                        start_time = time.perf_counter()
+                        cell = pick_next_cell(sudoku_state)
+                        stats.time_heuristic += time.perf_counter() - start_time
+                    stack.append([cell, sudoku_state.get_possible_values(cell), 0, len(trail)])
+    finally:
+        sudoku_state.trail = None  # Stop logging, e.g. once the solution is returned
+
+
+def trail_search(sudoku_state, level=PROPAGATION_NAKED_SINGLES, stats=None, budget=None):
+    """
+    Finds the first solution (if it exists) of the given Sudoku board with the iterative search of
+    iter_trail_solutions, changing a single SudokuState in place and rolling it back with its trail (undo log).
+    :param sudoku_state: Sudoku board configuration to be evaluated (SudokuState object). It is changed in place.
+    :param level: The propagation level applied after each assignment, see SudokuState.propagate.
+    :param stats: Optional SolverStats object the search counters and timings are added to.
+    :param budget: Optional SearchBudget object the nodes are reported to, limiting the search.
+    :return: The SudokuState representing the solved board, or None (indicating it is not solvable).
+    """
+    return next(iter_trail_solutions(sudoku_state, level, stats, budget), None)
+
+
+# Solver engines, selected through sudoku_solver(engine=...). An engine is a function
+#     engine(sudoku_state, level, stats[, budget]) -> SudokuState or None
+# given a valid, unsolved SudokuState with its constraints initialised and propagated, the propagation level to apply
+# after each assignment (engines may ignore it) and an optional SolverStats object to add its counters to (calling its
+# node and backtrack methods and adding to its timings). Limited solves (timeout or max_nodes) also pass a
+# SearchBudget, whose node method the engine calls on every node and which raises SolverGaveUp once a limit is
+# reached. It returns the solved SudokuState (it may change and return the given state) or None if the board has no
+# solution.
+ENGINES = {
+    "dfs": depth_first_search,  # Recursive search, copying the state for each possible value
+    "trail": trail_search,  # Iterative search, changing a single state in place and undoing its changes from a trail
+    "exact_cover": exact_cover_search,  # Algorithm X over the 324 exact cover constraints
+}
+
+
+def init_state(sudoku, propagation=None, stats=None):
+    """
+    Creates the SudokuState of a board, checks it and applies the propagation to it, ready to be searched.
+    :param sudoku: nxn numpy array, empty cells are designated by 0.
+    :param propagation: The propagation level, see sudoku_solver. None picks the default level for the board size.
+    :param stats: Optional SolverStats object the propagation counters are added to.
+    :return: Tuple of the SudokuState (None if the board is invalid or propagation shows it has no solution) and the
+    propagation level to apply after each assignment.
+    """
+    state = SudokuState.SudokuState(sudoku)
+    if propagation is None:
+        propagation = PROPAGATION_NAKED_SINGLES if state.geometry.box_size <= 3 else PROPAGATION_HIDDEN_SINGLES
+    if propagation not in range(len(PROPAGATION_STAGES)):
+        raise ValueError(f"Unknown propagation level {propagation!r}")
+    state.stats = stats  # Propagation counters are added by the state (and its copies)
+    if not state.is_valid_board():  # Check that the board is a valid configuration (contains unique values).
+        return None, propagation
+
+    if not state.is_goal():  # Boards that are already solved need no constraints
+        state.init_constraints()  # Generate the initial possible values
+        if not state.propagate(propagation):  # Apply the same inference to the initial board
+            return None, propagation
+    return state, propagation
+
+
+def sudoku_solver(sudoku, engine="dfs", propagation=None, stats=None, timeout=None, max_nodes=None):
     """
     Solves a Sudoku puzzle and returns its unique solution.
 
     Input
         sudoku : 9x9 numpy array
-            Empty cells are designated by 0.
+            Empty cells are designated by 0. Boards with any box size n (n^2 x n^2 arrays, e.g. 16x16 or 25x25) are
+            solved the same way.
+        engine : str or function
+            The search used to solve the puzzle, one of the keys of ENGINES ("dfs", "trail" or "exact_cover"), or a
+            function following the same engine interface.
+        propagation : int
+            The inference applied after each assignment, one of the SudokuState propagation levels:
+            PROPAGATION_NONE, PROPAGATION_NAKED_SINGLES, PROPAGATION_HIDDEN_SINGLES or PROPAGATION_PAIRS. Defaults to
+            naked singles for 9x9 boards and hidden singles for larger boards, where naked singles alone leave
+            too many positions to the search.
+        stats : SolverStats
+            Optional object the search and propagation counters (nodes, backtracks, maximum depth, singles, removed
+            candidates) and the time spent on the heuristics, propagation and copying are added to. Its hook, if it
+            has one, is called on every node and backtrack. Nothing is counted or timed when it is None.
+        timeout : float
+            Optional number of seconds the search may run for.
+        max_nodes : int
+            Optional number of nodes (values tried) the search may expand.
 
     Output
         9x9 numpy array of integers
             It contains the solution, if there is one. If there is no solution, all array entries should be -1.
-    """
-    solved = SudokuState.SudokuState(sudoku)
-    if not solved.is_valid_board():  # Check that the board is a valid configuration (contains unique values).
-        return np.full(shape=(9, 9), fill_value=-1, dtype=int)  # Return 9x9 matrix of -1s if it is not solvable
+            The output has the same shape as the input.
 
-    if solved.is_goal():  # Check if the given board is already solved
-        return solved.final_values  # If it is already solved, return it
+    Raises
+        SolverGaveUp
+            If the search reaches the timeout or max_nodes limit first, so it is not known whether there is a solution.
+    """
+    if not callable(engine):
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine {engine!r}, expected one of {sorted(ENGINES)}")
+        engine = ENGINES[engine]
+    solved, propagation = init_state(sudoku, propagation, stats)
+    no_solution = np.full(shape=np.shape(sudoku), fill_value=-1, dtype=int)  # Matrix of -1s, same shape as the board
+    if solved is None:
+        return no_solution  # Return matrix of -1s if it is invalid or has no solution
 
-    solved.init_constraints()  # Generate the initial possible values
-    solved = depth_first_search(solved)  # Attempt to solve the board using depth-first search
+    if not solved.is_goal():
+        if timeout is None and max_nodes is None:
+            solved = engine(solved, propagation, stats)  # Attempt to solve the board using the chosen engine
+        else:  # The limits are checked as the engine reports its nodes to the budget
+            solved = engine(solved, propagation, stats, SearchBudget(max_nodes, timeout))
 
     if not solved:
-        return np.full(shape=(9, 9), fill_value=-1, dtype=int)  # Return 9x9 matrix of -1s if it has no solution
+        return no_solution  # Return matrix of -1s if it has no solution
 
     return solved.final_values  # Return the final sudoku board configuration
+
+
+def iter_solutions(sudoku, propagation=PROPAGATION_HIDDEN_SINGLES, stats=None, timeout=None, max_nodes=None):
+    """
+    Lazily finds every solution of a Sudoku puzzle, with the search of the "trail" engine (see iter_trail_solutions).
+    The search only runs as far as needed for each solution asked for, and no solutions are kept, so stopping the
+    iteration (e.g. after the first two solutions) stops the search.
+
+    Input
+        sudoku : nxn numpy array
+            Empty cells are designated by 0.
+        propagation, stats, timeout, max_nodes
+            As for sudoku_solver. The limits count from the first solution asked for, over the whole iteration.
+            Propagation defaults to hidden singles for every board size, as a search that doesn't stop at the first
+            solution gains more from pruning.
+
+    Output
+        Generator of numpy arrays of integers
+            Each solution of the board, with the same shape as the input. Nothing is yielded if it has no solution.
+
+    Raises
+        SolverGaveUp
+            If the search reaches the timeout or max_nodes limit before the next solution is found.
+    """
+    state, propagation = init_state(sudoku, propagation, stats)
+    if state is None:
+        return
+    if state.is_goal():
+        yield state.final_values.reshape(np.shape(sudoku))  # Solved by the propagation, the only solution
+        return
+
+    budget = None if timeout is None and max_nodes is None else SearchBudget(max_nodes, timeout)
+    for solved in iter_trail_solutions(state, propagation, stats, budget):
+        yield solved.final_values.reshape(np.shape(sudoku))  # A copy, as the state changes when the search resumes
+
+
+def count_solutions(sudoku, limit=2, **solver_args):
+    """
+    Counts the solutions of a Sudoku puzzle, stopping the search as soon as limit solutions are found. With the default
+    limit of 2 it checks that a puzzle has a unique solution (a count of 1).
+    :param sudoku: nxn numpy array, empty cells are designated by 0.
+    :param limit: The number of solutions to stop at, or None to count every solution.
+    :param solver_args: Arguments passed on to iter_solutions (propagation, stats, timeout, max_nodes).
+    :return: The number of solutions, at most limit (0 if the board is invalid or has no solution).
+    :raises SolverGaveUp: If the search reaches the timeout or max_nodes limit first.
+    """
+    count = 0
+    if limit is not None and limit <= 0:
+        return count
+    solutions = iter_solutions(sudoku, **solver_args)
+    try:
+        for _ in solutions:
+            count += 1
+            if count == limit:
+                break
+    finally:
+        solutions.close()  # Only closes the generator, rather than leaving the suspended search to the GC
+    return count
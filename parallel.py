@@ -0,0 +1,116 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import batch
+import main
+import numpy as np
+
+# Shared memory views attached once by each worker process, see attach_boards.
+worker_boards = {}
+
+
+def attach_boards(puzzles_name, solutions_name, count):
+    """
+    Pool initializer, attaches the worker process to the shared puzzle and solution blocks.
+    :param puzzles_name: Name of the shared memory block holding the (count, 81) uint8 puzzles.
+    :param solutions_name: Name of the shared memory block the (count, 81) int8 solutions are written to.
+    :param count: The number of boards in the blocks.
+    :return: None
+    """
+    for key, name, dtype in (("puzzles", puzzles_name, np.uint8), ("solutions", solutions_name, np.int8)):
+        block = shared_memory.SharedMemory(name=name)
+        worker_boards[key + "_block"] = block  # Keep the block open for as long as the worker lives
+        worker_boards[key] = np.ndarray((count, 81), dtype=dtype, buffer=block.buf)
+
+
+def solve_chunk(start, end, engine, use_batch):
+    """
+    Solves the boards [start, end) of the shared puzzle block and writes them to the same rows of the solution block.
+    :param start: The first board of the chunk.
+    :param end: One past the last board of the chunk.
+    :param engine: The search used to solve the boards, see main.ENGINES.
+    :param use_batch: Whether to solve the chunk with batch.sudoku_solver_batch instead of board by board.
+    :return: The number of boards solved.
+    """
+    puzzles, solutions = worker_boards["puzzles"], worker_boards["solutions"]
+    if use_batch:
+        solutions[start:end] = batch.sudoku_solver_batch(puzzles[start:end], engine=engine).reshape(-1, 81)
+    else:
+        for i in range(start, end):
+            solutions[i] = main.sudoku_solver(puzzles[i].reshape(9, 9), engine=engine).ravel()
+    return end - start
+
+
+def sudoku_solver_parallel(puzzles, workers=None, chunk_size=1000, engine="dfs", use_batch=True):
+    """
+    Solves a batch of Sudoku puzzles in a pool of worker processes.
+    The puzzles are copied once into a shared memory block that every worker reads from, and each worker writes its
+    solutions straight into a second shared block, so no boards are pickled between processes. Only the (start, end)
+    range of each chunk is sent to the workers, and results are returned in input order.
+
+    Input
+        puzzles : (N, 9, 9) numpy array
+            Empty cells are designated by 0.
+        workers : int
+            The number of worker processes, defaults to the number of CPUs.
+        chunk_size : int
+            The number of boards given to a worker at a time.
+        engine : str
+            The search used to solve the boards, see main.ENGINES.
+        use_batch : bool
+            Solve each chunk with batch.sudoku_solver_batch (vectorized propagation) instead of board by board.
+
+    Output
+        (N, 9, 9) numpy array of integers
+            It contains the solution of each board, if there is one. Boards with no solution are filled with -1.
+    """
+    flat = np.asarray(puzzles).reshape(-1, 81)
+    count = len(flat)
+    invalid = ((flat < 0) | (flat > 9)).any(axis=1)  # Values outside the range (0, 9) don't fit in a uint8 block
+    if count == 0:
+        return np.empty((0, 9, 9), dtype=int)
+
+    puzzles_block = shared_memory.SharedMemory(create=True, size=count * 81)
+    solutions_block = shared_memory.SharedMemory(create=True, size=count * 81)
+    shared_puzzles = shared_solutions = None
+    try:
+        shared_puzzles = np.ndarray((count, 81), dtype=np.uint8, buffer=puzzles_block.buf)
+        shared_solutions = np.ndarray((count, 81), dtype=np.int8, buffer=solutions_block.buf)
+        shared_puzzles[:] = np.where(invalid[:, None], 0, flat)
+
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=attach_boards,
+                                 initargs=(puzzles_block.name, solutions_block.name, count)) as pool:
+            futures = [pool.submit(solve_chunk, start, min(start + chunk_size, count), engine, use_batch)
+                       for start in range(0, count, chunk_size)]
+            for future in futures:
+                future.result()  # Re-raise any error from the workers
+
+        solutions = shared_solutions.astype(int)
+    finally:
+        shared_puzzles = shared_solutions = None  # Release the views before closing the blocks
+        puzzles_block.close()
+        puzzles_block.unlink()
+        solutions_block.close()
+        solutions_block.unlink()
+
+    solutions[invalid] = -1
+    return solutions.reshape(-1, 9, 9)
+
+
+def speedup_curve(puzzles, worker_counts=(1, 2, 4, 8, 16, 32), **kwargs):
+    """
+    Measures the wall time of sudoku_solver_parallel on the given puzzles for each number of workers.
+    :param puzzles: (N, 9, 9) numpy array of puzzles.
+    :param worker_counts: The numbers of workers to measure.
+    :param kwargs: Extra arguments passed on to sudoku_solver_parallel.
+    :return: List of (workers, seconds, speedup) tuples, with the speedup relative to the first worker count.
+    """
+    curve = []
+    for workers in worker_counts:
+        start_time = time.perf_counter()
+        sudoku_solver_parallel(puzzles, workers=workers, **kwargs)
+        seconds = time.perf_counter() - start_time
+        curve.append((workers, seconds, curve[0][1] / seconds if curve else 1.0))
+    return curve
@@ -0,0 +1,93 @@
+import numpy as np
+from SudokuState import UNITS
+
+UNIT_CELLS = np.array(UNITS, dtype=np.intp)  # (27, 9) cells of each row, column and block
+
+# Status of each board returned by validate_boards, later statuses take precedence over earlier ones.
+STATUS_VALID = 0  # No conflicts (and, for complete boards, every unit holds the values 1 - 9)
+STATUS_INCOMPLETE = 1  # Complete boards only: some cells are empty, but no value appears twice in a unit
+STATUS_MISMATCH = 2  # validate_solutions only: the solution changes a given value of its puzzle
+STATUS_CONFLICT = 3  # A value appears more than once on a row, column or block
+STATUS_INVALID_VALUE = 4  # A cell holds a value outside the range (0, 9), e.g. the -1s of an unsolvable board
+
+
+def validate_boards(boards, complete=False, chunk_size=2000):
+    """
+    Checks a batch of boards for row, column and block conflicts in one vectorized pass per chunk, from the counts of
+    the values in each unit. The counts of all the units of a chunk are taken with a single np.bincount, each
+    unit's values offset into its own 10 bins (0 - 9), instead of summing a (N, 27, 9, 9) one-hot tensor. A complete
+    unit holds 1 - 9 exactly once when it has no empty cells and no value counted twice.
+    Partial boards (puzzles) are valid when no value appears twice in a unit, empty cells (0) are ignored. Complete
+    boards (solutions) are valid when every unit holds each value 1 - 9 exactly once.
+
+    Input
+        boards : (N, 9, 9) numpy array
+            Empty cells are designated by 0.
+        complete : bool
+            Check the boards as complete solutions instead of partial puzzles.
+        chunk_size : int
+            The number of boards checked together, bounding the size of the unit value and bincount arrays.
+
+    Output
+        Tuple of the status of each board and its offending units
+            (N,) int8 numpy array of statuses (STATUS_VALID, STATUS_INCOMPLETE, STATUS_CONFLICT or
+            STATUS_INVALID_VALUE) and (N, 27) boolean numpy array, True for the units (rows, columns then blocks) that
+            break the rules.
+    """
+    boards = np.asarray(boards).reshape(-1, 81)
+    statuses = np.empty(len(boards), dtype=np.int8)
+    bad_units = np.empty((len(boards), 27), dtype=bool)
+    for start in range(0, len(boards), chunk_size):
+        chunk = boards[start:start + chunk_size]
+        invalid_cells = (chunk < 0) | (chunk > 9)  # Values outside the range (0, 9)
+        bins = np.take(np.where(invalid_cells, 0, chunk).astype(np.intp), UNIT_CELLS, axis=1)  # (M, 27, 9) unit values
+        bins += np.arange(len(chunk) * 27, dtype=np.intp).reshape(-1, 27, 1) * 10  # Offset into the unit's bins
+        counts = np.bincount(bins.ravel(), minlength=len(chunk) * 270)  # Count of each value (0 - 9) in each unit
+        repeated = np.flatnonzero(counts > 1)  # Only a few bins in practice, cheaper than reducing every unit
+        repeated = repeated[repeated % 10 != 0]  # Empty cells (bin 0) may repeat
+        conflict_units = np.zeros(len(chunk) * 27, dtype=bool)
+        conflict_units[repeated // 10] = True
+        conflict_units = conflict_units.reshape(-1, 27)
+
+        status = np.full(len(chunk), STATUS_VALID, dtype=np.int8)
+        chunk_bad = conflict_units.copy()
+        if invalid_cells.any():
+            chunk_bad |= invalid_cells[:, UNIT_CELLS].any(axis=2)
+        if complete:
+            empty_units = counts[::10].reshape(-1, 27) > 0  # Units with empty cells (or invalid values)
+            status[empty_units.any(axis=1)] = STATUS_INCOMPLETE
+            chunk_bad |= empty_units
+        status[conflict_units.any(axis=1)] = STATUS_CONFLICT
+        status[invalid_cells.any(axis=1)] = STATUS_INVALID_VALUE
+        statuses[start:start + len(chunk)] = status
+        bad_units[start:start + len(chunk)] = chunk_bad
+    return statuses, bad_units
+
+
+def validate_solutions(puzzles, solutions, chunk_size=2000):
+    """
+    Checks a batch of solutions against their puzzles: each solution must be a valid complete board (see
+    validate_boards) that keeps every given value of its puzzle.
+
+    Input
+        puzzles : (N, 9, 9) numpy array
+            Empty cells are designated by 0.
+        solutions : (N, 9, 9) numpy array
+            The solution of each puzzle.
+        chunk_size : int
+            The number of boards checked together, bounding the size of the unit value and bincount arrays.
+
+    Output
+        Tuple of the status of each solution and its offending units
+            (N,) int8 numpy array of statuses (STATUS_MISMATCH for solutions that change a given value) and (N, 27)
+            boolean numpy array, True for the units of the solution that break the rules or change a given value.
+    """
+    puzzles, solutions = np.asarray(puzzles).reshape(-1, 81), np.asarray(solutions).reshape(-1, 81)
+    statuses, bad_units = validate_boards(solutions, complete=True, chunk_size=chunk_size)
+    for start in range(0, len(puzzles), chunk_size):
+        end = start + chunk_size
+        changed_cells = (puzzles[start:end] != 0) & (puzzles[start:end] != solutions[start:end])  # Givens not kept
+        status = statuses[start:end]
+        status[(status < STATUS_MISMATCH) & changed_cells.any(axis=1)] = STATUS_MISMATCH
+        bad_units[start:end] |= changed_cells[:, UNIT_CELLS].any(axis=2)
+    return statuses, bad_units